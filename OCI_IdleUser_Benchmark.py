@@ -0,0 +1,664 @@
+# coding: utf-8
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+# name: OCI_IdleUser_Benchmark.py
+# task: benchmark OCI_IdleUser_Disabler.py against a
+#       local Identity Domains stub,
+#       report users/sec and p99 call latency per mode
+#
+# Disclaimer:
+# This script is an independent tool and is not
+# affiliated with or supported by Oracle.
+# It is provided as-is and without any warranty
+#
+
+import os
+import sys
+import json
+import time
+import shlex
+import hashlib
+import argparse
+import tempfile
+import statistics
+import subprocess
+from modules.stub import SyntheticDomain, start_stub, USER_STATE_SCHEMA
+from modules.rawjson import check_parity, orjson, ijson
+from modules.utils import green, yellow, red, print_info, print_error
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+disabler_path = os.path.join(script_dir, 'OCI_IdleUser_Disabler.py')
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+# benchmarked modes, extra OCI_IdleUser_Disabler.py
+# arguments of each mode
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+MODES = {
+        'sequential': [],
+        'parallel': ['-workers', '4', '-dworkers', '8'],
+        'async': ['-async', '-concurrency', '16'],
+        'filter': ['-filter'],
+        'bulk': ['-bulk', '-workers', '4'],
+        'sharded': ['-shards', '4', '-dworkers', '8'],
+        'raw': ['-raw'],
+        }
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+# get command line arguments
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def parse_arguments():
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('-users', default='1000,10000', dest='users',
+                        help='Comma separated synthetic domain sizes, default: 1000,10000')
+    parser.add_argument('-modes', default='sequential,parallel,async', dest='modes',
+                        help=f'Comma separated modes among {",".join(MODES)}')
+    parser.add_argument('-latency', default=20, dest='latency', type=float,
+                        help='Stub latency per call in ms, default: 20')
+    parser.add_argument('-jitter', default=5, dest='jitter', type=float,
+                        help='Stub latency jitter in ms, default: 5')
+    parser.add_argument('-throttle', default=0.01, dest='throttle', type=float,
+                        help='Share of calls answered with a 429, default: 0.01')
+    parser.add_argument('-dryrun',action='store_true', default=False, dest='dryrun',
+                        help='Benchmark fetch & classify only')
+    parser.add_argument('-args', default='', dest='extra_args',
+                        help='Extra OCI_IdleUser_Disabler.py arguments for every run')
+    parser.add_argument('-parity',action='store_true', default=False, dest='parity',
+                        help='Check the -raw JSON decoders against SDK models on the synthetic users')
+    parser.add_argument('-bulkcheck',action='store_true', default=False, dest='bulkcheck',
+                        help='Check that -bulk re-queues only throttled operations, on a stub throttling 20%% of calls')
+    parser.add_argument('-sessioncheck',action='store_true', default=False, dest='sessioncheck',
+                        help='Check the shared per-endpoint session across raw & SDK clients and SDK session resets')
+    parser.add_argument('-projection',action='store_true', default=False, dest='projection',
+                        help='Compare bytes & SDK deserialization time of attributeSets=all and the attributes= projection')
+    parser.add_argument('-startup',action='store_true', default=False, dest='startup',
+                        help='Measure the time to the first list_users call with and without -fast')
+    parser.add_argument('-classify',action='store_true', default=False, dest='classify',
+                        help='Compare the strptime, fromisoformat & numpy login_days paths on 100k users')
+    parser.add_argument('-memory',action='store_true', default=False, dest='memory',
+                        help='Compare the memory of per-user dict rows & UserRecord on 100k users')
+    parser.add_argument('-save', default='', dest='save',
+                        help='Save results to a JSON file')
+    parser.add_argument('-baseline', default='', dest='baseline',
+                        help='Compare users/sec with a JSON file saved by -save')
+    parser.add_argument('-tolerance', default=20, dest='tolerance', type=float,
+                        help='Allowed users/sec regression against -baseline in percent, default: 20')
+
+    args = parser.parse_args()
+    unknown = [mode for mode in args.modes.split(',') if mode not in MODES]
+    if unknown:
+        parser.error(f'unknown modes: {",".join(unknown)}')
+
+    return args
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+# throwaway oci config for the stub
+# config file authentication with a generated key,
+# the tenancy name is pre-cached so -fast makes no
+# call outside the stub, HOME points to the sandbox
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def create_sandbox(path):
+
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+
+    oci_dir = os.path.join(path, '.oci')
+    os.makedirs(oci_dir)
+
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    key_file = os.path.join(oci_dir, 'bench.pem')
+    with open(key_file, 'wb') as pem:
+        pem.write(key.private_bytes(serialization.Encoding.PEM,
+                                    serialization.PrivateFormat.TraditionalOpenSSL,
+                                    serialization.NoEncryption()))
+
+    public_der = key.public_key().public_bytes(serialization.Encoding.DER,
+                                               serialization.PublicFormat.SubjectPublicKeyInfo)
+    digest = hashlib.md5(public_der).hexdigest()
+    fingerprint = ':'.join(digest[i:i + 2] for i in range(0, len(digest), 2))
+
+    tenancy = 'ocid1.tenancy.oc1..bench'
+    config_file = os.path.join(oci_dir, 'config')
+    with open(config_file, 'w') as config:
+        config.write(f"[DEFAULT]\nuser=ocid1.user.oc1..bench\nfingerprint={fingerprint}\n"
+                     f"tenancy={tenancy}\nregion=us-ashburn-1\nkey_file={key_file}\n")
+
+    with open(os.path.join(oci_dir, 'idleuser_tenancy_cache.json'), 'w') as cache:
+        json.dump({tenancy: {'name': 'bench', 'home_region_key': 'home region: stub', 'fetched': time.time()}}, cache)
+
+    return config_file
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+# read the Prometheus textfile of a run
+# output - {metric{labels}: value}
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def read_metrics(path):
+
+    samples = {}
+    with open(path, 'r') as metrics_file:
+        for line in metrics_file:
+            if line.startswith('#') or not line.strip():
+                continue
+            name, value = line.rsplit(' ', 1)
+            samples[name] = float(value)
+    return samples
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+# run OCI_IdleUser_Disabler.py once against the stub
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def run_once(cmd, sandbox, config_file, server, mode):
+
+    domain = server.domain
+    domain.reset()
+    metrics_file = os.path.join(sandbox, 'metrics.prom')
+
+    arguments = [sys.executable, disabler_path,
+                 '-cf', '-cfp', config_file, '-fast',
+                 '-endpoint', server.url,
+                 '-rate', '0',
+                 '-output', 'jsonl', '-outfile', os.devnull,
+                 '-metricsfile', metrics_file] + MODES[mode] + shlex.split(cmd.extra_args)
+    if cmd.dryrun:
+        arguments.append('-dryrun')
+
+    started = time.monotonic()
+    process = subprocess.run(arguments, env=dict(os.environ, HOME=sandbox),
+                             stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    wall = time.monotonic() - started
+
+    if process.returncode != 0 or not os.path.exists(metrics_file):
+        print_error("Benchmark run failed:", mode, domain.size, process.stderr.strip().splitlines()[-1:])
+        return None
+
+    samples = read_metrics(metrics_file)
+    os.remove(metrics_file)
+
+    evaluate = samples.get('oci_idleuser_phase_duration_seconds{phase="fetch & classify"}', 0)
+    disable = samples.get('oci_idleuser_phase_duration_seconds{phase="disable"}', 0)
+    disabled = len(domain.disabled)
+
+    return {
+            'mode': mode,
+            'users': domain.size,
+            'wall': round(wall, 3),
+            'users_per_sec': round(domain.size / evaluate, 1) if evaluate else 0,
+            'list_p99_ms': round(samples.get('oci_idleuser_call_latency_seconds{call="list_users",quantile="0.99"}', 0) * 1000, 1),
+            'disabled': disabled,
+            'disabled_per_sec': round(disabled / disable, 1) if disable else 0,
+            'disable_p99_ms': round(max(samples.get('oci_idleuser_call_latency_seconds{call="put_user_status_changer",quantile="0.99"}', 0),
+                                        samples.get('oci_idleuser_call_latency_seconds{call="bulk",quantile="0.99"}', 0)) * 1000, 1),
+            'retries': int(sum(value for name, value in samples.items() if name.startswith('oci_idleuser_call_retries_total')))
+            }
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+# parity of the raw json path with the sdk path
+# the stub users are parsed by each installed decoder
+# and by the sdk deserializer, user fields must match
+# output - True if every decoder matches
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def check_decoders(config_file, server):
+
+    import oci
+    import oci.identity_domains
+
+    config = oci.config.from_file(file_location=config_file)
+    base_client = oci.identity_domains.IdentityDomainsClient(config, service_endpoint=server.url).base_client
+    resources = [server.domain.user(index) for index in range(server.domain.size)]
+
+    passed = True
+    for decoder in ['json'] + (['orjson'] if orjson else []) + (['ijson'] if ijson else []):
+        mismatches = check_parity(resources, base_client, decoder=decoder)
+        if mismatches:
+            passed = False
+            print_error("Parity error:", decoder, f"{len(mismatches)} mismatches", *mismatches[0:3])
+        else:
+            print_info(green, 'Parity', decoder, f"{len(resources)} users match")
+
+    return passed
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+# re-queueing of the bulk disable path
+# a throttling stub serves existing users and one
+# deleted user, the posted batches are recorded:
+# the deleted user gets exactly one 404 and is not
+# re-queued, every throttled batch is a bulk retry
+# output - True if the bulk path behaves
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def check_bulk(size=40, batch_size=10, max_rounds=4, throttle=0.2):
+
+    import requests
+    from modules.classifier import UserRecord, State
+    from modules.disabler import disable_users_bulk, retryable
+    from modules.metrics import METRICS
+
+    server = start_stub(SyntheticDomain(size), throttle=throttle)
+    deleted = size + 1
+    users_disabled = {rank: UserRecord(server.domain.ocid(rank - 1), f"user{rank}", True, State.DORMANT)
+                      for rank in range(1, size + 1)}
+    users_disabled[deleted] = UserRecord(server.domain.ocid(size), 'deleted', True, State.DORMANT)
+
+    posts = []
+
+    class RecordingSession(requests.Session):
+        def post(self, url, **kwargs):
+            response = super().post(url, **kwargs)
+            posts.append((response.status_code, [operation['bulkId'] for operation in kwargs['json']['Operations']]))
+            return response
+
+    outcomes, elapsed = disable_users_bulk(server.url, None, users_disabled, batch_size=batch_size,
+                                           max_rounds=max_rounds, rate=0, progress=False, session=RecordingSession())
+    retries = METRICS.operations.get('bulk', {}).get('retries', 0)
+
+    server.shutdown()
+    server.server_close()
+
+    # throttled batches posted last for all their users were not retried, max_rounds was reached
+    last_post = {bulk_id: position for position, (status, bulk_ids) in enumerate(posts) for bulk_id in bulk_ids}
+    throttled = [position for position, (status, bulk_ids) in enumerate(posts) if status == 429]
+    final = [position for position in throttled if all(last_post[bulk_id] == position for bulk_id in posts[position][1])]
+    answered = sum(1 for status, bulk_ids in posts if status < 400 and str(deleted) in bulk_ids)
+    disabled = sum(1 for outcome in outcomes.values() if outcome['status'] == 'Disabled')
+
+    checks = [
+            ('deleted user answered once', answered == 1 and outcomes[deleted]['error'].startswith('404')),
+            ('throttled batches retried', retries == len(throttled) - len(final)),
+            ('other failures retryable', all(retryable(outcome['error']) for rank, outcome in outcomes.items()
+                                             if rank != deleted and outcome['status'] == 'Failed')),
+            ]
+
+    print_info(green, 'Bulk', f"{len(posts)} batches", f"{disabled} disabled, {len(throttled)} throttled, {retries} retries")
+    for check, passed in checks:
+        if not passed:
+            print_error("Bulk check failed:", check, *posts[0:3])
+
+    return all(passed for check, passed in checks)
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+# shared per-endpoint session
+# the raw json client creates the session first, the
+# sdk client created next must still get the sdk
+# https adapter, after a sdk session reset both
+# clients keep listing users on the same adapters
+# output - True if the session is shared as expected
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def check_sessions(config_file, server):
+
+    import oci
+    import oci.identity_domains
+    from modules.identity import new_client, get_session, reset_clients, HTTPS_ADAPTER
+    from modules.rawjson import RawUsersClient
+
+    reset_clients()
+    config = oci.config.from_file(file_location=config_file)
+    signer = oci.signer.Signer(config['tenancy'], config['user'], config['fingerprint'], config['key_file'])
+
+    raw_client = RawUsersClient(server.url, signer)
+    sdk_client = new_client(oci.identity_domains.IdentityDomainsClient, config, signer, server.url)
+    session = get_session(server.url)
+
+    checks = [
+            ('sdk client shares the raw client session', sdk_client.base_client.session is raw_client.session),
+            ('https adapter is the sdk adapter', type(session.get_adapter('https://')) is HTTPS_ADAPTER),
+            ]
+
+    sdk_client.base_client._reset_session(reason='session check')
+    reset = sdk_client.base_client.session
+
+    listed = [len(client.list_users(count=10).data.resources or []) for client in (raw_client, sdk_client, raw_client)]
+    checks += [
+            ('reset session keeps the shared adapters', reset is not session and reset.adapters == session.adapters),
+            ('both clients list users after a reset', listed == [min(10, server.domain.size)] * 3),
+            ]
+    reset_clients()
+
+    for check, passed in checks:
+        if not passed:
+            print_error("Session check failed:", check)
+    if all(passed for check, passed in checks):
+        print_info(green, 'Sessions', 'shared', f"{len(checks)} checks passed")
+
+    return all(passed for check, passed in checks)
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+# list_users payload of attributeSets=all against the
+# attributes= projection of USER_FIELDS
+# the pages are recorded once per variant, then the
+# recorded bodies are deserialized to sdk User models
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def compare_projection(config_file, server, page_size=1000):
+
+    import oci
+    import oci.identity_domains
+    import requests
+    from modules.users import USER_ATTRIBUTES, user_fields
+
+    config = oci.config.from_file(file_location=config_file)
+    base_client = oci.identity_domains.IdentityDomainsClient(config, service_endpoint=server.url).base_client
+    variants = {'all': {'attributeSets': 'all'}, 'projected': {'attributes': USER_ATTRIBUTES}}
+
+    print(f"\n{'projection':<12} {'users':>9} {'bytes':>12} {'bytes/user':>11} {'deserialize/s':>14} {'users/s':>10}")
+
+    measures = {}
+    with requests.Session() as session:
+        for variant, params in variants.items():
+
+            pages = []
+            for start_index in range(1, server.domain.size + 1, page_size):
+                # injected 429 are retried, a few times
+                for attempt in range(10):
+                    response = session.get(server.url + '/admin/v1/Users',
+                                           params=dict(params, startIndex=start_index, count=page_size))
+                    if response.status_code != 429:
+                        break
+                response.raise_for_status()
+                pages.append(response.content)
+
+            started = time.perf_counter()
+            users = 0
+            for content in pages:
+                for user in base_client.deserialize_response_data(content, 'Users').resources or []:
+                    user_fields(user)
+                    users += 1
+            elapsed = time.perf_counter() - started
+
+            size = sum(len(content) for content in pages)
+            measures[variant] = (size, elapsed)
+            print(f"{variant:<12} {users:>9} {size:>12} {size / users if users else 0:>11.0f} "
+                  f"{elapsed:>14.3f} {users / elapsed if elapsed else 0:>10.0f}")
+
+    (full_size, full_time), (size, elapsed) = measures['all'], measures['projected']
+    print(green(f"{'':<12} projection: {size / full_size * 100:.0f}% of the bytes, "
+                f"{full_time / elapsed if elapsed else 0:.1f}x faster deserialization"))
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+# time to the first list_users call of a run
+# with and without -fast, the launcher routes the
+# regional ObjectStorage & Identity endpoints of the
+# credential validation to the stub, so both paths
+# make their calls with the stub latency
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+STARTUP_LAUNCHER = """
+import os, sys, runpy
+os.environ.setdefault('OCI_PYTHON_SDK_NO_SERVICE_IMPORTS', 'true')
+import oci.regions
+stub_url = sys.argv.pop(1)
+oci.regions.endpoint_for = lambda *args, **kwargs: kwargs.get('endpoint') or stub_url
+sys.argv = sys.argv[1:]
+sys.path.insert(0, os.path.dirname(sys.argv[0]))
+runpy.run_path(sys.argv[0], run_name='__main__')
+"""
+
+STARTUP_VARIANTS = {
+                    'default': [],
+                    '-fast': ['-fast'],
+                    }
+
+def measure_startup(cmd, sandbox, config_file, repeats=5):
+
+    server = start_stub(SyntheticDomain(100), latency=cmd.latency / 1000, jitter=cmd.jitter / 1000)
+    print(f"\n{'startup':<12} {'runs':>9} {'first list/s':>13} {'wall/s':>8}")
+
+    for variant, arguments in STARTUP_VARIANTS.items():
+
+        first_list = []
+        walls = []
+        for run in range(repeats):
+            server.first_list = None
+            started = time.monotonic()
+            process = subprocess.run([sys.executable, '-c', STARTUP_LAUNCHER, server.url, disabler_path,
+                                      '-cf', '-cfp', config_file, '-endpoint', server.url, '-rate', '0', '-dryrun',
+                                      '-output', 'jsonl', '-outfile', os.devnull] + arguments,
+                                     env=dict(os.environ, HOME=sandbox),
+                                     stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+            walls.append(time.monotonic() - started)
+
+            if process.returncode != 0 or server.first_list is None:
+                print_error("Startup run failed:", variant, process.stderr.strip().splitlines()[-1:])
+                break
+            first_list.append(server.first_list - started)
+
+        if first_list:
+            print(f"{variant:<12} {len(first_list):>9} {statistics.median(first_list):>13.3f} {statistics.median(walls):>8.3f}")
+
+    server.shutdown()
+    server.server_close()
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+# login age of synthetic users, classification only
+# strptime per user, as before login_days, against
+# the fromisoformat & numpy datetime64 paths of
+# login_days, every path must give the same ages
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def compare_classify(size=100000):
+
+    from datetime import datetime
+    from modules import classifier
+
+    domain = SyntheticDomain(size)
+    last_logins = [(domain.user(index).get(USER_STATE_SCHEMA) or {}).get('lastSuccessfulLoginDate') for index in range(size)]
+    now = domain.now
+
+    def strptime_days():
+        return [(now - datetime.strptime(login, "%Y-%m-%dT%H:%M:%S.%fZ")).days if login else None for login in last_logins]
+
+    def fromisoformat_days():
+        # login_days falls back to fromisoformat when numpy is not installed
+        numpy, classifier.np = classifier.np, False
+        try:
+            return classifier.login_days(last_logins, now)
+        finally:
+            classifier.np = numpy
+
+    paths = {'strptime': strptime_days, 'fromisoformat': fromisoformat_days}
+    if classifier.load_numpy():
+        paths['numpy'] = lambda: classifier.login_days(last_logins, now)
+
+    print(f"\n{'login_days':<14} {'users':>9} {'classify/s':>11} {'users/s':>12} {'vs strptime':>12}")
+
+    reference = None
+    for path, login_days in paths.items():
+        started = time.perf_counter()
+        days = login_days()
+        elapsed = time.perf_counter() - started
+
+        reference = reference or (days, elapsed)
+        color = green if days == reference[0] else red
+        print(color(f"{path:<14} {size:>9} {elapsed:>11.3f} {size / elapsed if elapsed else 0:>12.0f} "
+                    f"{reference[1] / elapsed if elapsed else 0:>11.1f}x"))
+
+        if days != reference[0]:
+            print_error("Classification error:", path, "login ages differ from strptime")
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+# memory held by the evaluated users, traced with
+# tracemalloc, user fields & login ages are built
+# beforehand and shared by both layouts
+# dict rows: users_data & users_disabled copies, as
+#            before UserRecord
+# records: UserRecord, users_disabled by reference
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def compare_memory(size=100000, days_history=60):
+
+    import tracemalloc
+    from modules.classifier import Classifier, State, login_days
+    from modules.users import raw_user_fields
+
+    domain = SyntheticDomain(size)
+    classifier = Classifier(days_history, domain.now)
+    users = [raw_user_fields(domain.user(index)) for index in range(size)]
+    ages = login_days([fields['last_login'] for fields in users], classifier.now)
+
+    def dict_rows():
+        users_data = {}
+        users_disabled = {}
+        for user_rank, (fields, days) in enumerate(zip(users, ages), start=1):
+            state = 'Inactive' if days is None else 'Dormant' if days > days_history else 'Active'
+            users_data[user_rank] = {
+                                    'ocid': fields['ocid'],
+                                    'last_login': fields['last_login'] or 'None',
+                                    'state': state,
+                                    'active': 'True' if fields['active'] else 'False',
+                                    'days': '-' if days is None else days,
+                                    'name': fields['name'],
+                                    'domain': fields['domain'],
+                                    'created': fields['created']
+                                    }
+            if fields['active'] and state != 'Active':
+                user_data = users_data[user_rank]
+                users_disabled[user_rank] = {key: user_data[key] for key in ('ocid', 'last_login', 'name', 'active', 'state', 'days')}
+        return users_data, users_disabled
+
+    def records():
+        users_data = [classifier.record(fields, days) for fields, days in zip(users, ages)]
+        users_disabled = [record for record in users_data if record.active and record.state != State.ACTIVE]
+        return users_data, users_disabled
+
+    print(f"\n{'memory':<12} {'users':>9} {'disabled':>9} {'held MB':>9} {'peak MB':>9} {'bytes/user':>11}")
+
+    for layout, build in (('dict rows', dict_rows), ('records', records)):
+        tracemalloc.start()
+        users_data, users_disabled = build()
+        held, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        print(f"{layout:<12} {len(users_data):>9} {len(users_disabled):>9} {held / 2**20:>9.1f} {peak / 2**20:>9.1f} {held / size:>11.0f}")
+        del users_data, users_disabled
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+# print results and regressions against a baseline
+# output - True if no mode regressed
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def print_results(results, baseline, tolerance):
+
+    reference = {(result['mode'], result['users']): result for result in baseline}
+    passed = True
+
+    print(f"\n{'mode':<12} {'users':>9} {'wall/s':>8} {'users/s':>10} {'list p99':>9} {'disabled':>9} {'disabled/s':>11} {'put p99':>8} {'retries':>8} {'vs baseline':>12}")
+
+    for result in results:
+        previous = reference.get((result['mode'], result['users']))
+        change = ''
+        color = green
+        if previous and previous['users_per_sec']:
+            ratio = (result['users_per_sec'] - previous['users_per_sec']) / previous['users_per_sec'] * 100
+            change = f"{ratio:+.1f}%"
+            if ratio < -tolerance:
+                color = red
+                passed = False
+            elif ratio < 0:
+                color = yellow
+
+        print(color(
+            f"{result['mode']:<12} "
+            f"{result['users']:>9} "
+            f"{result['wall']:>8.2f} "
+            f"{result['users_per_sec']:>10.1f} "
+            f"{result['list_p99_ms']:>9.1f} "
+            f"{result['disabled']:>9} "
+            f"{result['disabled_per_sec']:>11.1f} "
+            f"{result['disable_p99_ms']:>8.1f} "
+            f"{result['retries']:>8} "
+            f"{change:>12}"
+        ))
+    print()
+
+    return passed
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+# run the benchmark
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+cmd = parse_arguments()
+
+baseline = []
+if cmd.baseline:
+    try:
+        with open(cmd.baseline, 'r') as baseline_file:
+            baseline = json.load(baseline_file)
+    except (OSError, ValueError) as e:
+        print_error("Baseline error:", cmd.baseline, e)
+        raise SystemExit(1)
+
+results = []
+parity = True
+bulk = True
+sessions = True
+
+with tempfile.TemporaryDirectory(prefix='idleuser_bench_') as sandbox:
+
+    config_file = create_sandbox(sandbox)
+
+    if cmd.bulkcheck:
+        bulk = check_bulk()
+
+    if cmd.startup:
+        measure_startup(cmd, sandbox, config_file)
+
+    if cmd.classify:
+        compare_classify()
+
+    if cmd.memory:
+        compare_memory()
+
+    for size in [int(size) for size in cmd.users.split(',')]:
+
+        server = start_stub(SyntheticDomain(size),
+                            latency=cmd.latency / 1000,
+                            jitter=cmd.jitter / 1000,
+                            throttle=cmd.throttle)
+        print_info(green, 'Stub', f'{size} users', server.url)
+
+        if cmd.parity:
+            parity = check_decoders(config_file, server) and parity
+
+        if cmd.sessioncheck:
+            sessions = check_sessions(config_file, server) and sessions
+
+        if cmd.projection:
+            compare_projection(config_file, server)
+
+        for mode in cmd.modes.split(','):
+            print(f"   Running {mode} on {size} users...", end=' '*10+'\r', file=sys.stderr, flush=True)
+            result = run_once(cmd, sandbox, config_file, server, mode)
+            if result:
+                results.append(result)
+
+        print(' '*94, end='\r', file=sys.stderr, flush=True)
+        server.shutdown()
+        server.server_close()
+
+passed = print_results(results, baseline, cmd.tolerance)
+
+if cmd.save:
+    with open(cmd.save, 'w') as save_file:
+        json.dump(results, save_file, indent=2)
+    print_info(green, 'Results', 'saved', cmd.save)
+
+if not parity:
+    print_error("Parity check failed:", "-raw user fields differ from the SDK path")
+    raise SystemExit(1)
+
+if not bulk:
+    print_error("Bulk check failed:", "-bulk re-queued permanent failures or missed throttled batches")
+    raise SystemExit(1)
+
+if not sessions:
+    print_error("Session check failed:", "the shared per-endpoint session lost the SDK adapter or a reset broke it")
+    raise SystemExit(1)
+
+if not passed:
+    print_error("Benchmark regression:", f"users/sec dropped more than {cmd.tolerance}% against", cmd.baseline)
+    raise SystemExit(1)
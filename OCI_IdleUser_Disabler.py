@@ -17,15 +17,53 @@
 #
 
 import os
+import sys
+import time
+
+# import only the oci services used by the script,
+# older SDKs otherwise load every service at import
+os.environ.setdefault('OCI_PYTHON_SDK_NO_SERVICE_IMPORTS', 'true')
+
 import oci
+import oci.identity_domains
 import argparse
+import multiprocessing
 from datetime import datetime, timezone
-from modules.identity import create_signer
-from modules.utils import green, yellow, red, clear, print_info, print_output, print_error
+from itertools import chain
+from modules.identity import create_signer, get_client, new_client, get_session, set_pool_size
+from modules.users import list_users_paged, list_users_parallel, candidate_filters, ocid_filters, filter_supported, merge_by_username, user_fields, raw_user_fields, USER_ATTRIBUTES
+from modules.async_engine import AsyncEngine
+from modules.state import StateStore
+from modules.classifier import Classifier, AgeDistribution, State, bucket, parse_timestamp
+from modules.report import open_report
+from modules.snapshot import SnapshotWriter, read_snapshot, read_snapshot_header
+from modules.journal import Journal, read_pending
+from modules.policy import Policy, read_policy
+from modules.shards import ShardedEvaluation
+from modules.rawjson import RawUsersClient
+from modules.daemon import Daemon, TokenRefresher
+from modules.metrics import METRICS
+from modules.domains import read_domains_file, discover_domains, run_domains, print_domains_summary
+from modules.disabler import disable_users, disable_users_bulk, print_outcomes
+from modules.utils import green, yellow, red, clear, set_terminal, Renderer, print_info, format_output, print_error, path_expander
 
 script_path = os.path.abspath(__file__)
 script_name = (os.path.basename(script_path))[:-3]
 
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+# parse -days, one or more comma separated thresholds
+# the first threshold is applied, others are what-if
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def days_list(value):
+    try:
+        thresholds = [int(days) for days in value.split(',') if days.strip()]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid days list: '{value}'")
+    if not thresholds or min(thresholds) <= 0:
+        raise argparse.ArgumentTypeError(f"days must be positive integers: '{value}'")
+    return list(dict.fromkeys(thresholds))
+
 # - - - - - - - - - - - - - - - - - - - - - - - - - -
 # get command line arguments
 # - - - - - - - - - - - - - - - - - - - - - - - - - -
@@ -41,200 +79,712 @@ def parse_arguments():
                         help='Path to your OCI config file, default: ~/.oci/config')
     parser.add_argument('-cp', default='DEFAULT', dest='config_profile', 
                         help='config file section to use, default: DEFAULT')
-    parser.add_argument('-endpoint', default='', dest='endpoint', required=True,
+    parser.add_argument('-endpoint', default='', dest='endpoint',
                         help='Identity Domain URL')
-    parser.add_argument('-days', default=60, dest='days', type=int, 
-                        help='Number of days of inactivity')
+    parser.add_argument('-domains', default='', dest='domains_file', 
+                        help='File listing Identity Domain URLs and optional config profiles, one per line')
+    parser.add_argument('-discover',action='store_true', default=False, dest='discover', 
+                        help='Discover all Identity Domains of the tenancy')
+    parser.add_argument('-maxdomains', default=4, dest='max_domains', type=int, 
+                        help='Number of Identity Domains processed concurrently, default: 4')
+    parser.add_argument('-fast',action='store_true', default=False, dest='fast', 
+                        help='Skip authentication probes and cache the tenancy name')
+    parser.add_argument('-days', default='60', dest='days', type=days_list, 
+                        help='Number of days of inactivity, a comma separated list adds what-if thresholds')
     parser.add_argument('-dryrun',action='store_true', default=False, dest='dryrun', 
                         help='Evaluate users without deactivating')
     parser.add_argument('-details',action='store_true', default=False, dest='details', 
                         help='Display full user ocids (76 char)')
+    parser.add_argument('-quiet',action='store_true', default=False, dest='quiet', 
+                        help='Print only the summary and the disabled users')
+    parser.add_argument('-pagesize', default=1000, dest='page_size', type=int, 
+                        help='Number of users retrieved per list_users call, default: 1000')
+    parser.add_argument('-workers', default=1, dest='workers', type=int, 
+                        help='Number of pages fetched concurrently, default: 1 (sequential)')
+    parser.add_argument('-dworkers', default=4, dest='disable_workers', type=int, 
+                        help='Number of users disabled concurrently, default: 4')
+    parser.add_argument('-rate', default=10, dest='rate', type=float, 
+                        help='Maximum status changes per second, default: 10')
+    parser.add_argument('-raw',action='store_true', default=False, dest='raw', 
+                        help='Read list_users pages as raw JSON (orjson/ijson when installed) instead of SDK models')
+    parser.add_argument('-shards', default=0, dest='shards', type=int, 
+                        help='Number of processes fetching & classifying startIndex shards, default: 0 (single process)')
+    parser.add_argument('-poolsize', default=0, dest='pool_size', type=int, 
+                        help='Keep-alive connections per endpoint, default: the larger of 10, -workers and -dworkers')
+    parser.add_argument('-async',action='store_true', default=False, dest='use_async', 
+                        help='Use the asyncio engine (aiohttp) for Identity Domains calls')
+    parser.add_argument('-concurrency', default=8, dest='concurrency', type=int, 
+                        help='Maximum concurrent requests of the asyncio engine, default: 8')
+    parser.add_argument('-output', default='', dest='output', choices=['jsonl', 'csv', 'parquet'], 
+                        help='Stream a machine-readable report instead of the colored tables')
+    parser.add_argument('-outfile', default='-', dest='output_file', 
+                        help='Report file for -output, default: - (stdout)')
+    parser.add_argument('-metrics',action='store_true', default=False, dest='metrics', 
+                        help='Print a timing breakdown of OCI calls after the summary')
+    parser.add_argument('-metricsfile', default='', dest='metrics_file', 
+                        help='Export metrics as a Prometheus textfile (node_exporter)')
+    parser.add_argument('-openmetrics',action='store_true', default=False, dest='openmetrics', 
+                        help='Export -metricsfile in OpenMetrics format')
+    parser.add_argument('-snapshot', default='', dest='snapshot', 
+                        help='Save the raw list_users responses to a compressed snapshot file')
+    parser.add_argument('-fromsnapshot', default='', dest='from_snapshot', 
+                        help='Evaluate users from a snapshot file instead of the IAM Domain, as of the time it was taken (no changes applied)')
+    parser.add_argument('-journal', default='', dest='journal', 
+                        help='Write-ahead journal of status changes, kept as an audit trail')
+    parser.add_argument('-resume',action='store_true', default=False, dest='resume', 
+                        help='Complete the pending status changes of the latest -journal run, pending users are evaluated again')
+    parser.add_argument('-daemon',action='store_true', default=False, dest='daemon', 
+                        help='Keep running and sweep every IAM Domain on a schedule')
+    parser.add_argument('-interval', default=60, dest='interval', type=float, 
+                        help='Minutes between two sweeps of a domain in -daemon mode, default: 60')
+    parser.add_argument('-jitter', default=60, dest='jitter', type=float, 
+                        help='Random seconds added to or removed from -interval, default: 60')
+    parser.add_argument('-statusport', default=8700, dest='status_port', type=int, 
+                        help='Local port of the -daemon status endpoint, 0 disables it, default: 8700')
+    parser.add_argument('-policy', default='', dest='policy_file', 
+                        help='JSON policy file: exempt userNames & groups, creation grace period, per-group days')
+    parser.add_argument('-filter',action='store_true', default=False, dest='server_filter', 
+                        help='Retrieve only dormant & inactive candidates using server-side filters')
+    parser.add_argument('-state', default='', dest='state_file', 
+                        help='Path to a local state cache enabling incremental runs')
+    parser.add_argument('-full',action='store_true', default=False, dest='full', 
+                        help='Force a full refresh of the state cache')
+    parser.add_argument('-drift',action='store_true', default=False, dest='drift', 
+                        help='Report drift between the state cache and the IAM Domain, prune users deleted on the server')
+    parser.add_argument('-bulk',action='store_true', default=False, dest='bulk', 
+                        help='Disable users through the SCIM Bulk endpoint')
+    parser.add_argument('-bulksize', default=50, dest='bulk_size', type=int, 
+                        help='Number of operations per Bulk request, default: 50')
     
-    return parser.parse_args()
+    args = parser.parse_args()
+    if not (args.endpoint or args.domains_file or args.discover or args.from_snapshot):
+        parser.error('one of -endpoint, -domains, -discover or -fromsnapshot is required')
+    if args.snapshot and (args.domains_file or args.discover or args.from_snapshot):
+        parser.error('-snapshot saves a single IAM Domain, use it with -endpoint only')
+    if args.snapshot and (args.server_filter or args.state_file):
+        parser.error('-snapshot needs a full fetch, it cannot be combined with -filter or -state')
+    if args.shards > 1 and (args.domains_file or args.discover or args.from_snapshot):
+        parser.error('-shards evaluates a single IAM Domain, use it with -endpoint only')
+    if args.shards > 1 and (args.use_async or args.server_filter or args.state_file or args.snapshot):
+        parser.error('-shards cannot be combined with -async, -filter, -state or -snapshot')
+    if args.shards > 1 and 'fork' not in multiprocessing.get_all_start_methods():
+        parser.error('-shards requires fork based worker processes (Linux, macOS)')
+    if args.from_snapshot and (args.domains_file or args.discover):
+        parser.error('-fromsnapshot cannot be combined with -domains or -discover')
+    if args.resume and not args.journal:
+        parser.error('-resume requires -journal')
+    if args.resume and (args.from_snapshot or args.dryrun):
+        parser.error('-resume cannot be combined with -fromsnapshot or -dryrun')
+    if args.daemon and (args.output or args.from_snapshot or args.snapshot or args.resume):
+        parser.error('-daemon cannot be combined with -output, -snapshot, -fromsnapshot or -resume')
+
+    return args
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+# print user status summary
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def print_summary(summary):
+    # -filter fetches only candidates, active & disabled users are not counted
+    active, disabled = ('n/a (not evaluated with -filter)',) * 2 if summary.get('filtered') else (summary["active"], summary["disabled"])
+    print('\n  - User Status Summary:')
+    print(f'{" ":<5} {"* Active:":<12} {active:<5}')
+    print(f'{" ":<5} {"* Disabled:":<12} {disabled:<5}')
+    print(f'{" ":<5} {"* Inactive:":<12} {summary["inactive"]:<5}')
+    print(f'{" ":<5} {"* Dormant:":<12} {summary["dormant"]:<5}')
+    if summary.get('exempt'):
+        print(f'{" ":<5} {"* Exempt:":<12} {summary["exempt"]:<5}')
+    print()
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+# print login age distribution & what-if thresholds
+# counts of active users, first threshold is applied
+# -filter fetches only candidates, the histogram is
+# left out, threshold counts stay complete
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def print_age_distribution(ages, thresholds, filtered=False):
+
+    total = len(ages.ages) + ages.never
+
+    if filtered:
+        print('  - Login Age Distribution: n/a (not evaluated with -filter)')
+    else:
+        print('  - Login Age Distribution (active users):')
+        for label, count in ages.histogram():
+            share = count / total * 100 if total else 0
+            print(f'{" ":<5} {"* " + label + ":":<20} {count:<8} {share:>5.1f}% {"#" * round(share / 2)}')
+
+    print(f'\n{" ":<5} {"threshold":<12} {"dormant":<10} {"inactive":<10} {"to disable":<12}')
+    for threshold in thresholds:
+        dormant = ages.dormant_count(threshold)
+        color = yellow if threshold == thresholds[0] else green
+        print(color(f'{" ":<5} {str(threshold) + " days":<12} {dormant:<10} {ages.never:<10} {dormant + ages.never:<12}'))
+    print()
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+# retrieve, evaluate & disable users of one IAM Domain
+# input - endpoint, config and signer to use
+# output - summary counters of the domain
+# quiet hides per-user rows when domains run concurrently,
+# -quiet also hides them but keeps the disabled users
+# writer streams rows to a machine-readable report
+# journal records planned & completed status changes
+# engine is the asyncio engine of -async or None
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def evaluate_domain(cmd, endpoint, config, signer, engine=None, quiet=False, writer=None, journal=None):
+
+    thresholds = cmd.days
+    days_history = thresholds[0]
+    details = cmd.details
+
+    # the disabled users are listed unless domains run concurrently
+    show_disabled = not quiet
+    quiet = quiet or cmd.quiet
+
+    # worker threads get their own client on the shared keep-alive session
+    def domain_client():
+        return new_client(oci.identity_domains.IdentityDomainsClient, config, signer, endpoint)
+
+    # raw json list_users skips sdk model deserialization
+    def users_client():
+        return RawUsersClient(endpoint, signer) if cmd.raw else domain_client()
+
+    # offline evaluation of a snapshot makes no oci call,
+    # users are evaluated as of the time it was taken
+    offline = bool(cmd.from_snapshot)
+    now = parse_timestamp(read_snapshot_header(cmd.from_snapshot)['taken']) if offline else None
+
+    # cached client, stays warm between daemon sweeps
+    identity_domain_client = get_client(oci.identity_domains.IdentityDomainsClient, config, signer, endpoint) if not offline else None
+
+    snapshot = SnapshotWriter(cmd.snapshot, endpoint) if cmd.snapshot else None
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - -
+    # retrieve user fields with the selected engine
+    # the snapshot, if any, records the full fetch
+    # - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    def fetch_users(snapshot=None, **kwargs):
+        if offline:
+            return (raw_user_fields(resource) for resource in read_snapshot(cmd.from_snapshot))
+        if engine:
+            resources = engine.list_users(
+                                        page_size=cmd.page_size,
+                                        progress=not quiet,
+                                        scim_filter=kwargs.get('filter'),
+                                        attributes=kwargs.get('attributes', USER_ATTRIBUTES)
+                                        )
+            if snapshot:
+                resources = snapshot.tee(resources)
+            return (raw_user_fields(resource) for resource in resources)
+        if cmd.workers > 1:
+            users = list_users_parallel(
+                                        users_client,
+                                        page_size=cmd.page_size,
+                                        workers=cmd.workers,
+                                        progress=not quiet,
+                                        **kwargs
+                                        )
+        else:
+            users = list_users_paged(
+                                    RawUsersClient(endpoint, signer) if cmd.raw else identity_domain_client,
+                                    page_size=cmd.page_size,
+                                    progress=not quiet,
+                                    **kwargs
+                                    )
+        if cmd.raw:
+            if snapshot:
+                users = snapshot.tee(users)
+            return (raw_user_fields(user) for user in users)
+        if snapshot:
+            users = snapshot.tee(users, identity_domain_client.base_client.sanitize_for_serialization)
+        return (user_fields(user) for user in users)
+
+    users_disabled = {}
+    filtered = False
+
+    active_users = 0
+    inactive_users = 0
+    dormant_users = 0
+    disabled_users = 0
+    failed_users = 0
+    exempt_users = 0
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - -
+    # exemption policy, group memberships are fetched
+    # once into an ocid -> groups index
+    # - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    policy = Policy(read_policy(cmd.policy_file), days_history, now=now) if cmd.policy_file else None
+
+    if policy and policy.group_names:
+        if offline:
+            print_error("Policy groups ignored:", "group memberships are not part of snapshots", level='INFO')
+        else:
+            policy.load_groups(identity_domain_client, page_size=cmd.page_size, progress=not quiet)
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - -
+    # state cache & incremental refresh
+    # - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    def cache_users(users):
+        for fields in users:
+            store.upsert(fields)
+            yield fields
+
+    refresh_started = datetime.now(timezone.utc)
+    store = StateStore(cmd.state_file, endpoint) if cmd.state_file and not offline and not cmd.resume else None
+    changes_filter = store.changes_filter() if store and not cmd.full else None
+    users = None
+
+    # fall back to a full refresh if the domain rejects the incremental filter
+    if changes_filter and not filter_supported(identity_domain_client, changes_filter):
+        print_error("Incremental filter rejected by the IAM Domain", "falling back to a full refresh", level='INFO')
+        changes_filter = None
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - -
+    # resume the pending status changes of the journal
+    # pending users are fetched again by ocid and
+    # evaluated again, users who logged in, were enabled
+    # or exempted since the plan are not disabled
+    # - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    resumed = read_pending(cmd.journal, endpoint) if cmd.resume else None
+
+    if resumed is not None:
+        users = chain.from_iterable(fetch_users(filter=scim_filter)
+                                    for scim_filter in ocid_filters(record.ocid for record in resumed.values()))
+        if not quiet:
+            print_info(yellow, 'Journal', 'resume', f"{len(resumed)} pending users")
+
+    if store and cmd.drift:
+        drift = store.drift(fetch_users(attributes="ocid,meta.lastModified"))
+        print_info(yellow if any(drift.values()) else green, 'Cache drift', 'missing/unknown/stale',
+                   f"{len(drift['missing'])}/{len(drift['unknown'])}/{len(drift['stale'])}")
+        # missing users were deleted on the server
+        if drift['missing']:
+            store.delete(drift['missing'])
+            print_info(green, 'Cache', 'pruned', f"{len(drift['missing'])} deleted users")
+
+    if changes_filter:
+        # merge users changed since the last run into the cached view
+        changed = 0
+        for fields in fetch_users(filter=changes_filter):
+            store.upsert(fields)
+            changed += 1
+        if not quiet:
+            print_info(green, 'Cache', 'incremental', f"{changed} changed users")
+        users = store.users()
+
+    elif cmd.server_filter and not store and not offline and resumed is None:
+        # the lowest threshold, group overrides included, keeps every count complete
+        filters = candidate_filters(min(thresholds + (list(policy.group_days.values()) if policy else [])))
+
+        # fall back to client-side evaluation if the domain rejects a filter
+        if all(filter_supported(identity_domain_client, scim_filter) for scim_filter in filters):
+            users = merge_by_username(*(fetch_users(filter=scim_filter) for scim_filter in filters))
+            filtered = True
+        elif not quiet:
+            print_error("Filter rejected by the IAM Domain", "falling back to client-side evaluation", level='INFO')
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - -
+    # sharded evaluation, worker processes fetch &
+    # classify startIndex shards of the domain
+    # - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    sharded = ShardedEvaluation(
+                                config,
+                                signer,
+                                endpoint,
+                                shards=cmd.shards,
+                                page_size=cmd.page_size,
+                                days_history=days_history,
+                                raw=cmd.raw
+                                ) if cmd.shards > 1 and resumed is None else None
+
+    if users is None and not sharded:
+        users = fetch_users(snapshot=snapshot)
+        if store:
+            if not quiet:
+                print_info(green, 'Cache', 'full refresh', cmd.state_file)
+            users = cache_users(users)
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - -
+    # retrieve & evaluate users data page by page
+    # - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    if not quiet:
+        print(f"{'#':<5} {'user':<40} {'last connection':<30} {'active':<10} {'state':<10} {'hist/days':<13} {'ocid':<40}")
+
+    classifier = Classifier(days_history, now)
+    ages = AgeDistribution()
+    renderer = Renderer()
+    phase_started = time.monotonic()
+
+    records = sharded.records(progress=not quiet) if sharded else classifier.classify_stream(users, chunk_size=cmd.page_size)
+
+    for user_rank, record in enumerate(records, start=1):
+
+        if policy:
+            policy.apply(record)
+
+        user_bucket = bucket(record)
+
+        if user_bucket == State.DISABLED:
+            color = red
+            disabled_users += 1
+        elif record.exempt and user_bucket != State.ACTIVE:
+            color = green
+            exempt_users += 1
+        elif user_bucket == State.DORMANT:
+            color = yellow
+            dormant_users += 1
+        elif user_bucket == State.INACTIVE:
+            color = yellow
+            inactive_users += 1
+        else:
+            color = green
+            active_users += 1
+
+        if not quiet:
+            renderer.write(format_output(color, user_rank, record, details=details))
+
+        if writer:
+            writer.write_user(endpoint, user_rank, record)
+
+        if store:
+            store.record_verdict(record.ocid, record.state.value, record.active)
+
+        ages.add(record)
+
+        # - - - - - - - - - - - - - - - - - - - - - - - - - -
+        # collect inactive users
+        # - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+        if record.active and record.state in (State.DORMANT, State.INACTIVE) and not record.exempt:
+            users_disabled[user_rank] = record
+
+    renderer.flush()
+    ages.sort()
+    METRICS.record_phase('fetch & classify', time.monotonic() - phase_started)
+
+    if sharded and not quiet:
+        sharded.print_report()
+
+    if resumed:
+        # close the plans of users who are no longer candidates
+        candidates = {record.ocid for record in users_disabled.values()}
+        for record in resumed.values():
+            if record.ocid not in candidates:
+                journal.complete(endpoint, record, {'status': 'Skipped', 'error': 'no longer a candidate'})
+
+    if store:
+        if not changes_filter:
+            store.prune()
+        store.set_watermark(refresh_started)
+
+    if snapshot:
+        snapshot.close()
+        if not quiet:
+            print_info(green, 'Snapshot', f"{snapshot.count} users", cmd.snapshot)
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - -
+    # disable inactive & dormant users
+    # - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    if not cmd.dryrun and not offline:
+        if users_disabled:
+            phase_started = time.monotonic()
+            on_outcome = None
+
+            if journal:
+                if resumed is None:
+                    journal.plan(endpoint, users_disabled)
+                on_outcome = lambda user_rank, outcome: journal.complete(endpoint, users_disabled[user_rank], outcome)
+
+            if engine and not cmd.bulk:
+                outcomes, elapsed = engine.disable_users(users_disabled, on_outcome=on_outcome)
+            elif cmd.bulk:
+                outcomes, elapsed = disable_users_bulk(
+                                                    endpoint,
+                                                    signer,
+                                                    users_disabled,
+                                                    batch_size=cmd.bulk_size,
+                                                    rate=cmd.rate,
+                                                    progress=not quiet,
+                                                    session=get_session(endpoint),
+                                                    on_outcome=on_outcome
+                                                    )
+            else:
+                outcomes, elapsed = disable_users(
+                                                domain_client,
+                                                users_disabled,
+                                                workers=cmd.disable_workers,
+                                                rate=cmd.rate,
+                                                progress=not quiet,
+                                                on_outcome=on_outcome
+                                                )
+
+            for user_rank, outcome in sorted(outcomes.items()):
+                if writer:
+                    writer.write_outcome(endpoint, user_rank, users_disabled[user_rank], outcome)
+
+                if outcome['status'] != 'Disabled':
+                    failed_users += 1
+                    # the user was deleted on the server, drop it from the cache
+                    if store and outcome['error'].startswith('404'):
+                        store.delete([users_disabled[user_rank].ocid])
+                    continue
+
+                # update user record
+                record = users_disabled[user_rank]
+                record.active = outcome['active']
+
+                disabled_users += 1
+                if record.state == State.DORMANT:
+                    dormant_users -= 1
+                else:
+                    inactive_users -= 1
+
+                if store:
+                    store.record_verdict(record.ocid, State.DISABLED.value, False)
+
+            METRICS.record_phase('disable', time.monotonic() - phase_started)
+
+            if show_disabled:
+                print_outcomes(users_disabled, outcomes, elapsed, details=details)
+
+    elif cmd.quiet and show_disabled and users_disabled:
+        # -quiet lists the users -dryrun would disable
+        renderer.write(f"\n{'#':<5} {'user':<40} {'last connection':<30} {'active':<10} {'state':<10} {'hist/days':<13} {'ocid':<40}")
+        for user_rank, record in users_disabled.items():
+            renderer.write(format_output(yellow, user_rank, record, details=details))
+        renderer.flush()
+
+    if store:
+        store.close()
+
+    return {
+            'endpoint': endpoint,
+            'active': active_users,
+            'disabled': disabled_users,
+            'inactive': inactive_users,
+            'dormant': dormant_users,
+            'failed': failed_users,
+            'exempt': exempt_users,
+            'filtered': filtered,
+            'ages': ages
+            }
 
 # - - - - - - - - - - - - - - - - - - - - - - - - - -
-# clear shell screen
+# evaluate one IAM Domain
+# the asyncio engine is closed even if the domain
+# fails, so no session is left open
 # - - - - - - - - - - - - - - - - - - - - - - - - - -
 
-clear()
+def run_domain(cmd, endpoint, config, signer, quiet=False, writer=None, journal=None):
+
+    engine = AsyncEngine(endpoint, signer, concurrency=cmd.concurrency, rate=cmd.rate) if cmd.use_async and not cmd.from_snapshot else None
+
+    try:
+        return evaluate_domain(cmd, endpoint, config, signer, engine, quiet=quiet, writer=writer, journal=journal)
+    finally:
+        if engine:
+            engine.close()
 
 # - - - - - - - - - - - - - - - - - - - - - - - - - -
 # retrieve arguments
 # - - - - - - - - - - - - - - - - - - - - - - - - - -
 
 cmd = parse_arguments()
-days_history = 60 if not cmd.days else cmd.days
-details = cmd.details
+set_pool_size(cmd.pool_size or max(10, cmd.workers, cmd.disable_workers))
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+# machine-readable report or clear shell screen
+# the report owns stdout, everything else is written
+# to stderr and the screen is not cleared
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+writer = None
+
+if cmd.output:
+    writer = open_report(cmd.output, cmd.output_file, sys.stdout)
+    sys.stdout = sys.stderr
+else:
+    clear()
+
+# ANSI colors only on a terminal, -quiet hides info lines
+set_terminal(sys.stdout, quiet=cmd.quiet)
 
 # - - - - - - - - - - - - - - - - - - - - - - - - - -
 # print header
 # - - - - - - - - - - - - - - - - - - - - - - - - - -
 
-print(green(f"\n{'*'*94:94}"))
+if not cmd.quiet:
+    print(green(f"\n{'*'*94:94}"))
 print_info(green, 'Analysis', 'started', script_name)
 
 if cmd.dryrun:
     print_info(yellow, 'Dry Run', 'session', 'no changes applied')
 
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+# write-ahead journal shared by all domains
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+journal = Journal(cmd.journal) if cmd.journal and not (cmd.dryrun or cmd.from_snapshot) else None
+
 # - - - - - - - - - - - - - - - - - - - - - - - - - -
 # oci authentication
+# skipped when evaluating a snapshot offline
 # - - - - - - - - - - - - - - - - - - - - - - - - - -
 
-config, signer, oci_tname=create_signer(
-                                        cmd.config_file_path, 
-                                        cmd.config_profile, 
-                                        cmd.is_delegation_token, 
-                                        cmd.is_config_file)
+if not cmd.from_snapshot:
+    with METRICS.timed('create_signer'), METRICS.phase('auth'):
+        config, signer, oci_tname=create_signer(
+                                                cmd.config_file_path, 
+                                                cmd.config_profile, 
+                                                cmd.is_delegation_token, 
+                                                cmd.is_config_file,
+                                                fast=cmd.fast)
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+# offline evaluation of a snapshot
+# no authentication, no changes applied
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+if cmd.from_snapshot:
+
+    snapshot_header = read_snapshot_header(cmd.from_snapshot)
+    print_info(yellow, 'Snapshot', snapshot_header['taken'], 'no changes applied')
+    if not cmd.quiet:
+        print(green(f"{'*'*94:94}\n"))
 
-identity_client=oci.identity.IdentityClient(
-                                            config=config)
+    summary = run_domain(cmd, snapshot_header['endpoint'], None, None, quiet=bool(writer), writer=writer)
+    print_summary(summary)
 
 # - - - - - - - - - - - - - - - - - - - - - - - - - -
-# init oci service clients
+# single IAM Domain
 # - - - - - - - - - - - - - - - - - - - - - - - - - -
 
-identity_domain_client=oci.identity_domains.IdentityDomainsClient(config, cmd.endpoint)
+elif cmd.endpoint and not (cmd.domains_file or cmd.discover or cmd.daemon):
 
-print(green(f"{'*'*94:94}\n"))
+    if not cmd.quiet:
+        print(green(f"{'*'*94:94}\n"))
+
+    try:
+        summary = run_domain(cmd, cmd.endpoint, config, signer, quiet=bool(writer), writer=writer, journal=journal)
+    except oci.exceptions.ServiceError as e:
+        # with -fast, invalid credentials are first reported here
+        print_error("Identity Domain error:", cmd.endpoint, e.status, e.code, e.message)
+        raise SystemExit(1)
+
+    print_summary(summary)
 
 # - - - - - - - - - - - - - - - - - - - - - - - - - -
-# retrieve users data
+# multiple IAM Domains & tenancies
+# signers are created once per config profile and
+# shared by all domains using that profile
 # - - - - - - - - - - - - - - - - - - - - - - - - - -
 
-user_rank = 0
-users_data = {}
-users_disabled = {}
+else:
 
-users=identity_domain_client.list_users(
-                                        attribute_sets=["all"],
-                                        sort_by="userName",
-                                        sort_order="ASCENDING",
-                                        count=1000
-                                        )
+    signers = {cmd.config_profile: (config, signer)}
+    domains = []
 
-for user in users.data.resources:
+    if cmd.endpoint:
+        domains.append((cmd.endpoint, cmd.config_profile))
 
-    user_rank=user_rank+1
-    try:
-        last_login = user.urn_ietf_params_scim_schemas_oracle_idcs_extension_user_state_user.last_successful_login_date
-        last_login = "None" if last_login is None else last_login
-
-        users_data[user_rank] = {
-                                'ocid': user.ocid,
-                                'last_login': last_login,
-                                'state': '',
-                                'active': 'True' if user.active else 'False',
-                                'days': '',
-                                'name': user.user_name,
-                                'domain': user.domain_ocid,
-                                'created': user.meta.created
-                                }
-
-        # convert the timestamp string to a datetime object
-        timestamp = datetime.strptime(last_login, "%Y-%m-%dT%H:%M:%S.%fZ")
-
-        # get the current datetime in UTC & remove timezone information
-        now = datetime.now(timezone.utc).replace(tzinfo=None)
-
-        # calculate the difference between the current datetime and the provided timestamp
-        time_difference = now - timestamp
-
-        # check if the difference is greater than x days
-        if time_difference.days > days_history:
-            users_data[user_rank]['state'] = 'Dormant'
-            users_data[user_rank]['days'] = time_difference.days
-        else:
-            users_data[user_rank]['state'] = 'Active'
-            users_data[user_rank]['days'] = time_difference.days
-            
-    except:
-        last_login = "None"
-        users_data[user_rank] = {
-        'ocid': user.ocid,
-        'last_login': last_login,
-        'state': 'Inactive',
-        'active': 'True' if user.active else 'False',
-        'days': '-',
-        'name': user.user_name,
-        'domain': user.domain_ocid,
-        'created': user.meta.created
-        }
-
-print(f"{'#':<5} {'user':<40} {'last connection':<30} {'active':<10} {'state':<10} {'hist/days':<13} {'ocid':<40}")
-
-active_users = 0
-inactive_users = 0
-dormant_users = 0
-disabled_users = 0
-
-for user_rank, user_data in users_data.items():
-
-    if user_data['active'] == 'False':
-        color = red
-        disabled_users += 1
-    elif user_data['state'] == 'Dormant':
-        color = yellow
-        dormant_users += 1
-    elif user_data['state'] == 'Inactive':
-        color = yellow
-        inactive_users += 1
-    else:
-        color = green
-        active_users += 1
+    if cmd.domains_file:
+        domains.extend(read_domains_file(cmd.domains_file, cmd.config_profile))
+
+    if cmd.discover:
+        domains.extend((url, cmd.config_profile) for url in discover_domains(config, signer))
 
-    print_output(color, user_rank, user_data, details=details)
+    # config profiles only apply to config file authentication
+    if not cmd.is_config_file:
+        domains = [(endpoint, cmd.config_profile) for endpoint, _ in domains]
+
+    domains = list(dict.fromkeys(domains))
+
+    for endpoint, profile in domains:
+        if profile not in signers:
+            with METRICS.timed('create_signer'), METRICS.phase('auth'):
+                profile_config, profile_signer, _ = create_signer(
+                                                                cmd.config_file_path,
+                                                                profile,
+                                                                cmd.is_delegation_token,
+                                                                cmd.is_config_file,
+                                                                fast=cmd.fast)
+            signers[profile] = (profile_config, profile_signer)
 
     # - - - - - - - - - - - - - - - - - - - - - - - - - -
-    # collect inactive users
+    # daemon mode, signers & clients stay warm and
+    # domains are swept one at a time on a schedule
     # - - - - - - - - - - - - - - - - - - - - - - - - - -
 
-    if user_data['active'] == 'True':
-        if user_data['state'] in ['Dormant', 'Inactive']:
-            users_disabled[user_rank] = {
-                                        'ocid': user_data['ocid'],
-                                        'last_login': user_data['last_login'],
-                                        'name': user_data['name'],
-                                        'active': user_data['active'],
-                                        'state': user_data['state'],
-                                        'days': user_data['days'],
-                                        'ocid': user_data['ocid']
-                                        }
+    if cmd.daemon:
+
+        def sweep(endpoint, profile):
+            summary = run_domain(cmd, endpoint, *signers[profile], quiet=True, journal=journal)
+            if cmd.metrics_file:
+                METRICS.export(path_expander(cmd.metrics_file), openmetrics=cmd.openmetrics)
+            return summary
+
+        print_info(green, 'Daemon', 'every', f"{cmd.interval:g} min +/- {cmd.jitter:g}s, {len(domains)} domains")
+        if not cmd.quiet:
+            print(green(f"{'*'*94:94}\n"))
+
+        refresher = TokenRefresher([domain_signer for _, domain_signer in signers.values()]).start()
+        Daemon(sweep, domains, interval=cmd.interval * 60, jitter=cmd.jitter, status_port=cmd.status_port).run_forever()
+        refresher.stop()
+
+        if journal:
+            journal.close()
+        raise SystemExit(0)
+
+    print_info(green, 'Domains', 'concurrent', f"{len(domains)} domains, {cmd.max_domains} at a time")
+    if not cmd.quiet:
+        print(green(f"{'*'*94:94}\n"))
+
+    results = run_domains(
+                        lambda endpoint, profile: run_domain(cmd, endpoint, *signers[profile], quiet=True, writer=writer, journal=journal),
+                        domains,
+                        max_domains=cmd.max_domains
+                        )
+
+    summary = print_domains_summary(results)
+    print_summary(summary)
+
+    summary['ages'] = AgeDistribution()
+    for result in results:
+        if 'ages' in result:
+            summary['ages'].merge(result['ages'])
+    summary['ages'].sort()
 
 # - - - - - - - - - - - - - - - - - - - - - - - - - -
-# disable inactive & dormant users
+# login age distribution & what-if thresholds
 # - - - - - - - - - - - - - - - - - - - - - - - - - -
 
-if not cmd.dryrun:
-    if users_disabled:
-        print(f"\n\n{'#':<5} {'user disabled':<40} {'updated_on':<30} {'active':<10} {'state':<10} {'hist/days':<13} {'ocid':<40}")
+if not (cmd.resume or cmd.quiet):
+    print_age_distribution(summary['ages'], cmd.days, filtered=summary.get('filtered'))
 
-        for user_rank, user_data in users_disabled.items():
-            try:
-                # https://docs.oracle.com/en/cloud/paas/identity-cloud/rest-api/op-admin-v1-userstatuschanger-id-put.html
-                put_user_status_changer_response = identity_domain_client.put_user_status_changer(
-                    user_status_changer_id=user_data['ocid'],
-                    user_status_changer=oci.identity_domains.models.UserStatusChanger(
-                    schemas=["urn:ietf:params:scim:schemas:oracle:idcs:UserStatusChanger"], # comment this line out will display an error showing the schema to use
-                    active=False))
+if journal:
+    journal.close()
 
-                # update user data
-                user_data['last_login'] = put_user_status_changer_response.data.meta.last_modified
-                user_data['active'] = 'True' if put_user_status_changer_response.data.active else 'False'
+if writer:
+    for threshold in cmd.days:
+        writer.write_threshold(threshold, summary['ages'].dormant(threshold), summary['ages'].never_names)
+    writer.write_summary(summary)
+    writer.close()
 
-                disabled_users += 1
-                if user_data.get('state') == "Dormant":
-                    dormant_users -= 1
-                else:
-                    inactive_users -= 1
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+# timing report & metrics export
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+if cmd.metrics:
+    METRICS.print_report()
 
-                print_output(red, user_rank, user_data, details=details)
-  
-            except Exception as error:
-                print_error("Error Disabling User:", user_data['name'], error)
-                pass
-
-print('\n  - User Status Summary:')
-print(f'{" ":<5} {"* Active:":<12} {active_users:<5}')
-print(f'{" ":<5} {"* Disabled:":<12} {disabled_users:<5}')
-print(f'{" ":<5} {"* Inactive:":<12} {inactive_users:<5}')
-print(f'{" ":<5} {"* Dormant:":<12} {dormant_users:<5}\n')
\ No newline at end of file
+if cmd.metrics_file:
+    METRICS.export(path_expander(cmd.metrics_file), openmetrics=cmd.openmetrics)
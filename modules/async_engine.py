@@ -0,0 +1,245 @@
+# coding: utf-8
+
+import sys
+import json
+import time
+import random
+import asyncio
+import threading
+import oci
+import requests
+from modules.users import USER_ATTRIBUTES, print_progress
+from modules.utils import print_error
+from modules.metrics import METRICS
+
+USER_STATUS_CHANGER_SCHEMA = "urn:ietf:params:scim:schemas:oracle:idcs:UserStatusChanger"
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+# sign a request with an oci signer
+# oci signers sign requests' PreparedRequest objects,
+# the signed url, headers and body are then sent as is
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def sign_request(signer, method, url, params=None, body=None):
+
+    request = requests.Request(method, url, params=params,
+                               data=json.dumps(body) if body is not None else None,
+                               headers={'Content-Type': 'application/json', 'Accept': 'application/json'})
+    prepared = signer(request.prepare())
+
+    return prepared.url, dict(prepared.headers), prepared.body
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+# asyncio engine for the Identity Domains REST calls
+# runs one event loop in a background thread with a
+# shared keep-alive connection pool, concurrency is
+# capped by a semaphore
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+class AsyncEngine:
+
+    def __init__(self, endpoint, signer, concurrency=8, rate=0, max_attempts=3, base_sleep=2, max_sleep=5):
+
+        # imported here, aiohttp is slow to import and only needed with -async
+        try:
+            import aiohttp
+            import yarl
+        except ImportError:
+            print_error("Async engine error:", "aiohttp is not installed", "pip3 install aiohttp")
+            raise SystemExit(1)
+
+        self.aiohttp = aiohttp
+        self.yarl = yarl
+        self.endpoint = endpoint.rstrip('/')
+        self.signer = signer
+        self.concurrency = max(1, concurrency)
+        self.rate = rate
+        self.next_slot = 0
+        # same limits as custom_retry_strategy
+        self.max_attempts = max_attempts
+        self.base_sleep = base_sleep
+        self.max_sleep = max_sleep
+
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        self.session = self.run(self.open_session())
+
+    async def open_session(self):
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+        connector = self.aiohttp.TCPConnector(limit=self.concurrency, keepalive_timeout=60)
+        return self.aiohttp.ClientSession(connector=connector, timeout=self.aiohttp.ClientTimeout(total=60))
+
+    def run(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    def close(self):
+        self.run(self.session.close())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - -
+    # signed request, retried on 429, 5xx & transport
+    # errors, a body that is not json is returned as
+    # the error detail, status 0 once transport errors
+    # exhausted the attempts
+    # output - (status, json body)
+    # - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    async def request(self, name, method, path, params=None, body=None):
+
+        for attempt in range(1, self.max_attempts + 1):
+            # sign on every attempt, the date header is part of the signature
+            url, headers, data = sign_request(self.signer, method, self.endpoint + path, params, body)
+
+            async with self.semaphore:
+                started = time.monotonic()
+                try:
+                    async with self.session.request(method, self.yarl.URL(url, encoded=True), headers=headers, data=data) as response:
+                        status = response.status
+                        content = await response.read()
+                except (self.aiohttp.ClientError, asyncio.TimeoutError) as error:
+                    METRICS.observe(name, time.monotonic() - started, error=True)
+                    if attempt == self.max_attempts:
+                        # reported as a failed call, not a traceback
+                        return 0, {'detail': str(error) or type(error).__name__}
+                    status, content = 0, b''
+                else:
+                    METRICS.observe(name, time.monotonic() - started, error=status >= 400, received=len(content))
+
+            if status and ((status != 429 and status < 500) or attempt == self.max_attempts):
+                try:
+                    return status, json.loads(content) if content else {}
+                except ValueError:
+                    return status, {'detail': content[0:200].decode('utf-8', 'replace')}
+
+            METRICS.retry(name)
+            await asyncio.sleep(random.uniform(0, min(self.max_sleep, self.base_sleep * 2 ** attempt)))
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - -
+    # list users
+    # first page gives totalResults, remaining pages are
+    # fetched concurrently and yielded in startIndex order
+    # - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    async def fetch_page(self, start_index, page_size, params):
+
+        status, payload = await self.request('list_users', 'GET', '/admin/v1/Users',
+                                             dict(params, startIndex=start_index, count=page_size))
+        if status == 0 or status >= 400:
+            # reported like the sdk path
+            raise oci.exceptions.ServiceError(status, payload.get('code') or str(status), {},
+                                              payload.get('detail') or payload.get('message') or 'list users failed')
+        return payload
+
+    async def pages(self, page_size, params):
+
+        first_page = await self.fetch_page(1, page_size, params)
+        resources = first_page.get('Resources') or []
+        yield resources
+
+        if not resources:
+            return
+
+        step = len(resources)
+        total_results = first_page.get('totalResults') or step
+        offsets = list(range(1 + step, total_results + 1, step))
+
+        # bounded window of pages in flight so memory stays flat
+        window = self.concurrency * 2
+        pending = [asyncio.ensure_future(self.fetch_page(offset, page_size, params)) for offset in offsets[:window]]
+        next_offset = len(pending)
+
+        try:
+            while pending:
+                page = await pending.pop(0)
+                if next_offset < len(offsets):
+                    pending.append(asyncio.ensure_future(self.fetch_page(offsets[next_offset], page_size, params)))
+                    next_offset += 1
+                yield page.get('Resources') or []
+        finally:
+            # pages still in flight after an error
+            for future in pending:
+                future.cancel()
+
+    def list_users(self, page_size=1000, progress=True, scim_filter=None, attributes=USER_ATTRIBUTES):
+
+        params = {'sortBy': 'userName', 'sortOrder': 'ASCENDING', 'attributes': attributes}
+        if scim_filter:
+            params['filter'] = scim_filter
+
+        pages = self.pages(page_size, params)
+        start_time = time.monotonic()
+        count = 0
+        fetched = 0
+
+        while True:
+            try:
+                page = self.run(pages.__anext__())
+            except StopAsyncIteration:
+                break
+            count += 1
+            fetched += len(page)
+            if progress:
+                print_progress(count, fetched, start_time)
+            for resource in page:
+                yield resource
+
+        if progress:
+            print(' '*94, end='\r', file=sys.stderr, flush=True)
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - -
+    # disable users
+    # output - {rank: outcome} like disabler.disable_users
+    # - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    async def throttle(self):
+        # spaces status changes 1/rate seconds apart, the loop is single threaded
+        if self.rate <= 0:
+            return
+        now = self.loop.time()
+        slot = max(now, self.next_slot)
+        self.next_slot = slot + 1 / self.rate
+        await asyncio.sleep(slot - now)
+
+    async def disable_user(self, record):
+
+        await self.throttle()
+        started = time.monotonic()
+        body = {'schemas': [USER_STATUS_CHANGER_SCHEMA], 'active': False}
+        try:
+            status, payload = await self.request('put_user_status_changer', 'PUT', f'/admin/v1/UserStatusChanger/{record.ocid}', body=body)
+        except Exception as error:
+            status, payload = 0, {'detail': str(error)}
+
+        if 200 <= status < 300:
+            return {
+                    'status': 'Disabled',
+                    'error': '',
+                    'latency': time.monotonic() - started,
+                    'last_modified': (payload.get('meta') or {}).get('lastModified'),
+                    'active': bool(payload.get('active'))
+                    }
+        return {
+                'status': 'Failed',
+                'error': f"{status} {payload.get('detail', '')}".strip(),
+                'latency': time.monotonic() - started,
+                'last_modified': None,
+                'active': record.active
+                }
+
+    async def disable_one(self, user_rank, record, on_outcome):
+        outcome = await self.disable_user(record)
+        if on_outcome:
+            on_outcome(user_rank, outcome)
+        return outcome
+
+    async def disable_all(self, users_disabled, on_outcome=None):
+        ranks = list(users_disabled)
+        outcomes = await asyncio.gather(*(self.disable_one(rank, users_disabled[rank], on_outcome) for rank in ranks))
+        return dict(zip(ranks, outcomes))
+
+    def disable_users(self, users_disabled, on_outcome=None):
+        start_time = time.monotonic()
+        outcomes = self.run(self.disable_all(users_disabled, on_outcome))
+        return outcomes, time.monotonic() - start_time
@@ -0,0 +1,233 @@
+# coding: utf-8
+
+from enum import Enum
+from array import array
+from bisect import bisect_right
+from datetime import datetime, timezone
+from itertools import islice
+
+# numpy is imported by the first login_days batch,
+# False once the import failed
+np = None
+
+def load_numpy():
+    global np
+    if np is None:
+        try:
+            import numpy
+            np = numpy
+        except ImportError:
+            np = False
+    return np
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+# user state derived from the last login
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+class State(Enum):
+    ACTIVE = 'Active'
+    DORMANT = 'Dormant'
+    INACTIVE = 'Inactive'
+    DISABLED = 'Disabled'
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+# evaluated user
+# one slotted record per user, shared by reference
+# between the classifier, format_output & the disable
+# engine instead of per-user dict copies
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+class UserRecord:
+
+    __slots__ = ('ocid', 'name', 'active', 'state', 'days', 'last_login', 'domain', 'created', 'exempt')
+
+    def __init__(self, ocid, name, active, state, days=None, last_login=None, domain=None, created=None, exempt=None):
+        self.ocid = ocid                # str
+        self.name = name                # str
+        self.active = active            # bool
+        self.state = state              # State
+        self.days = days                # int or None if never logged in
+        self.last_login = last_login    # str or None
+        self.domain = domain            # str
+        self.created = created          # str
+        self.exempt = exempt            # policy exemption reason or None
+
+    def __repr__(self):
+        return f"UserRecord({self.name!r}, active={self.active}, state={self.state.value}, days={self.days})"
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+# parse IDCS timestamps
+# '2023-12-12T10:00:00.000Z' as naive UTC datetime,
+# None for users who never logged in
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def parse_timestamp(timestamp):
+
+    if not timestamp or timestamp == 'None':
+        return None
+    if timestamp[-1] == 'Z':
+        timestamp = timestamp[:-1]
+    try:
+        return datetime.fromisoformat(timestamp)
+    except ValueError:
+        # fromisoformat before python 3.11 only accepts 3 or 6 fraction digits
+        return datetime.strptime(timestamp, "%Y-%m-%dT%H:%M:%S.%f")
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+# days elapsed since each login
+# uses a numpy datetime64 batch when available
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def login_days(last_logins, now):
+
+    if len(last_logins) > 1 and load_numpy():
+        try:
+            stamps = np.array([login[:-1] if login else 'NaT' for login in last_logins], dtype='datetime64[ms]')
+            with np.errstate(invalid='ignore'):
+                elapsed = (np.datetime64(now, 'ms') - stamps) // np.timedelta64(1, 'D')
+            return [None if not login else int(days) for login, days in zip(last_logins, elapsed)]
+        except ValueError:
+            pass
+
+    days = []
+    for login in last_logins:
+        timestamp = parse_timestamp(login)
+        days.append(None if timestamp is None else (now - timestamp).days)
+    return days
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+# state of a user for a threshold in days
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def login_state(days, days_history):
+
+    if days is None:
+        return State.INACTIVE
+    if days > days_history:
+        return State.DORMANT
+    return State.ACTIVE
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+# classify users
+# the cutoff is computed once per run so every user
+# is compared to the same 'now'
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+class Classifier:
+
+    def __init__(self, days_history, now=None):
+        self.days_history = days_history
+        # current datetime in UTC without timezone information
+        self.now = now or datetime.now(timezone.utc).replace(tzinfo=None)
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - -
+    # build the record of one user from its fields
+    # - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    def record(self, fields, days):
+
+        return UserRecord(
+                        fields['ocid'],
+                        fields['name'],
+                        bool(fields['active']),
+                        login_state(days, self.days_history),
+                        days,
+                        fields['last_login'] if days is not None else None,
+                        fields['domain'],
+                        fields['created']
+                        )
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - -
+    # classify a stream of user fields chunk by chunk
+    # - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    def classify_stream(self, users, chunk_size=1000):
+
+        users = iter(users)
+        while True:
+            chunk = list(islice(users, chunk_size))
+            if not chunk:
+                return
+            days = login_days([fields['last_login'] for fields in chunk], self.now)
+            for fields, user_days in zip(chunk, days):
+                yield self.record(fields, user_days)
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+# summary bucket of a classified user
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def bucket(record):
+    return State.DISABLED if not record.active else record.state
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+# login age distribution of active users
+# exempted users are left out
+# ages & userNames are collected in the classification
+# pass and sorted once, dormant counts & members of any
+# threshold are then a bisect over the sorted ages
+# only userNames are kept, not the user records
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+AGE_BUCKETS = (7, 30, 60, 90, 180, 365)
+
+class AgeDistribution:
+
+    def __init__(self):
+        self.ages = array('i')  # login age in days of active users, sorted once sort() is called
+        self.names = []         # userNames in the order of self.ages
+        self.never_names = []   # userNames of active users who never logged in
+
+    @property
+    def never(self):
+        return len(self.never_names)
+
+    def add(self, record):
+        if not record.active or record.exempt:
+            return
+        if record.days is None:
+            self.never_names.append(record.name)
+        else:
+            self.ages.append(record.days)
+            self.names.append(record.name)
+
+    def merge(self, other):
+        self.ages.extend(other.ages)
+        self.names.extend(other.names)
+        self.never_names.extend(other.never_names)
+        return self
+
+    def sort(self):
+        order = sorted(range(len(self.ages)), key=self.ages.__getitem__)
+        self.ages = array('i', (self.ages[index] for index in order))
+        self.names = [self.names[index] for index in order]
+        return self
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - -
+    # active users dormant for a threshold in days,
+    # same rule as Classifier: more than threshold days
+    # output - count or userNames, oldest login last
+    # - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    def dormant_count(self, threshold):
+        return len(self.ages) - bisect_right(self.ages, threshold)
+
+    def dormant(self, threshold):
+        return self.names[bisect_right(self.ages, threshold):]
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - -
+    # histogram of login ages
+    # output - [(label, count)] with the never logged in
+    # - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    def histogram(self, bounds=AGE_BUCKETS):
+
+        buckets = []
+        lower, start = 0, 0
+        for bound in bounds:
+            end = bisect_right(self.ages, bound)
+            buckets.append((f"{lower}-{bound} days", end - start))
+            lower, start = bound + 1, end
+        buckets.append((f"> {bounds[-1]} days", len(self.ages) - start))
+        buckets.append(("never logged in", self.never))
+
+        return buckets
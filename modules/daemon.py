@@ -0,0 +1,201 @@
+# coding: utf-8
+
+import json
+import time
+import heapq
+import random
+import signal
+import threading
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from modules.metrics import METRICS
+from modules.utils import green, yellow, red, print_info, print_error
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+# refresh security tokens in the background
+# instance principals & delegation token signers are
+# refreshed once half of the token lifetime elapsed,
+# so sweeps never wait on a token refresh
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+class TokenRefresher:
+
+    def __init__(self, signers, check_interval=60):
+        self.signers = [signer for signer in signers if hasattr(signer, 'refresh_security_token')]
+        self.check_interval = check_interval
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self):
+        if self.signers:
+            self.thread.start()
+        return self
+
+    def run(self):
+        while not self.stop_event.wait(self.check_interval):
+            for signer in self.signers:
+                try:
+                    token = getattr(signer, 'security_token', None)
+                    if token is None or not token.valid_with_half_expiration_time():
+                        with METRICS.timed('refresh_security_token'):
+                            signer.refresh_security_token()
+                except Exception as e:
+                    # the sdk refreshes the token again on the next call
+                    print_error("Token refresh error:", e, color=yellow, level='WARNING')
+
+    def stop(self):
+        self.stop_event.set()
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+# local HTTP status endpoint
+# GET /status   last sweep of each domain as json
+# GET /metrics  Prometheus text of the run metrics
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+class StatusHandler(BaseHTTPRequestHandler):
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+
+        if self.path in ('/', '/status'):
+            body = json.dumps(self.server.daemon.status(), indent=2).encode()
+            content_type = 'application/json'
+        elif self.path == '/metrics':
+            body = METRICS.render().encode()
+            content_type = 'text/plain; version=0.0.4'
+        else:
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+# sweep scheduler
+# each domain is swept every interval seconds plus or
+# minus jitter, domains are swept one at a time from
+# a single thread so sweeps never overlap, a late
+# domain runs as soon as the current sweep ends
+# input - sweep(endpoint, profile) returning summary
+#         counters, list of (endpoint, profile)
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+class Daemon:
+
+    def __init__(self, sweep, domains, interval=3600, jitter=60, status_port=0):
+        self.sweep = sweep
+        self.domains = domains
+        self.interval = interval
+        self.jitter = jitter
+        self.status_port = status_port
+        self.started = datetime.now(timezone.utc)
+        self.stop_event = threading.Event()
+        self.lock = threading.Lock()
+        self.running = None
+        self.results = {endpoint: {'profile': profile, 'sweeps': 0, 'next_run': None}
+                        for endpoint, profile in domains}
+
+    def next_delay(self):
+        return max(0, self.interval + random.uniform(-self.jitter, self.jitter))
+
+    def status(self):
+        with self.lock:
+            return {
+                    'started': self.started.isoformat(),
+                    'interval': self.interval,
+                    'jitter': self.jitter,
+                    'running': self.running,
+                    'domains': {endpoint: dict(result) for endpoint, result in self.results.items()}
+                    }
+
+    def stop(self, *args):
+        self.stop_event.set()
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - -
+    # run one sweep and record its outcome
+    # - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    def run_sweep(self, endpoint, profile):
+
+        with self.lock:
+            self.running = endpoint
+        started = datetime.now(timezone.utc)
+        start_time = time.monotonic()
+
+        try:
+            with METRICS.timed('sweep'):
+                summary = self.sweep(endpoint, profile)
+            error = ''
+        except (Exception, SystemExit) as e:
+            # SystemExit raised by helpers must not stop the daemon
+            summary = {}
+            error = 'aborted' if isinstance(e, SystemExit) else str(e) or type(e).__name__
+
+        duration = time.monotonic() - start_time
+        counters = {key: summary.get(key, 0) for key in ('active', 'disabled', 'inactive', 'dormant', 'failed')}
+        if summary.get('filtered'):
+            # -filter fetches only candidates, active & disabled users are not counted
+            counters['active'] = counters['disabled'] = None
+
+        with self.lock:
+            self.running = None
+            result = self.results[endpoint]
+            result.update(counters)
+            result['sweeps'] += 1
+            result['last_start'] = started.isoformat()
+            result['last_duration'] = round(duration, 3)
+            result['error'] = error
+
+        color = red if error else yellow if counters['failed'] else green
+        print_info(color, 'Sweep', endpoint[8:38] if endpoint.startswith('https://') else endpoint[0:30],
+                   error[0:30] if error else f"{duration:.1f}s, {counters['dormant'] + counters['inactive']} idle, {counters['failed']} failed")
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - -
+    # run until SIGINT or SIGTERM
+    # the first sweep of each domain is spread over
+    # the jitter window
+    # - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    def run_forever(self):
+
+        for signal_number in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signal_number, self.stop)
+
+        server = None
+        if self.status_port:
+            server = ThreadingHTTPServer(('127.0.0.1', self.status_port), StatusHandler)
+            server.daemon_threads = True
+            server.daemon = self
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            print_info(green, 'Daemon', 'status', f"http://127.0.0.1:{server.server_port}/status")
+
+        now = time.monotonic()
+        queue = [(now + random.uniform(0, self.jitter), index) for index in range(len(self.domains))]
+        heapq.heapify(queue)
+
+        while queue and not self.stop_event.is_set():
+            due, index = queue[0]
+            if self.stop_event.wait(max(0, due - time.monotonic())):
+                break
+            heapq.heappop(queue)
+
+            endpoint, profile = self.domains[index]
+            self.run_sweep(endpoint, profile)
+
+            delay = self.next_delay()
+            heapq.heappush(queue, (time.monotonic() + delay, index))
+            with self.lock:
+                self.results[endpoint]['next_run'] = datetime.fromtimestamp(time.time() + delay, timezone.utc).isoformat()
+
+        if server:
+            server.shutdown()
+            server.server_close()
+
+        print_info(yellow, 'Daemon', 'stopped', f"{sum(result['sweeps'] for result in self.results.values())} sweeps")
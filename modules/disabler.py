@@ -0,0 +1,296 @@
+# coding: utf-8
+
+import oci
+import oci.identity_domains
+import sys
+import requests
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from modules.identity import custom_retry_strategy
+from modules.metrics import METRICS, RetryCounter
+from modules.utils import green, yellow, red, Renderer
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+# token bucket rate limiter
+# shared by all workers, refills at 'rate' tokens
+# per second up to 'burst' tokens
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+class TokenBucket:
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.capacity = float(burst if burst else max(1, rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+# retryable failure of a status change
+# 429, 5xx and transport errors, read from the status
+# code the outcome error starts with, 0 or no code
+# when the request got no response
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def retryable(error):
+    code = (error or '').split(' ', 1)[0]
+    if not code.isdigit():
+        return True
+    return int(code) in (0, 429) or int(code) >= 500
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+# disable one user
+# 429 and 5xx are retried by custom_retry_strategy
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def disable_user(identity_domain_client, user_ocid):
+
+    # https://docs.oracle.com/en/cloud/paas/identity-cloud/rest-api/op-admin-v1-userstatuschanger-id-put.html
+    put_user_status_changer = METRICS.wrap('put_user_status_changer', identity_domain_client.put_user_status_changer)
+
+    return put_user_status_changer(
+        user_status_changer_id=user_ocid,
+        user_status_changer=oci.identity_domains.models.UserStatusChanger(
+        schemas=["urn:ietf:params:scim:schemas:oracle:idcs:UserStatusChanger"], # comment this line out will display an error showing the schema to use
+        active=False),
+        retry_strategy=RetryCounter(custom_retry_strategy, 'put_user_status_changer'))
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+# disable users on a bounded worker pool
+# input - users_disabled {rank: UserRecord}
+#         on_outcome(rank, outcome) called as each
+#         user completes, e.g. to journal it
+# output - {rank: outcome} with status, error, latency
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def disable_users(client_factory, users_disabled, workers=4, rate=10, burst=None, progress=True, on_outcome=None):
+
+    bucket = TokenBucket(rate, burst)
+    local = threading.local()
+    outcomes = {}
+
+    def worker(user_rank, record):
+        if not hasattr(local, 'client'):
+            local.client = client_factory()
+        bucket.acquire()
+        started = time.monotonic()
+        try:
+            response = disable_user(local.client, record.ocid)
+            return user_rank, {
+                            'status': 'Disabled',
+                            'error': '',
+                            'latency': time.monotonic() - started,
+                            'last_modified': response.data.meta.last_modified,
+                            'active': bool(response.data.active)
+                            }
+        except Exception as error:
+            message = f"{error.status} {error.code}" if isinstance(error, oci.exceptions.ServiceError) else str(error)
+            return user_rank, {
+                            'status': 'Failed',
+                            'error': message,
+                            'latency': time.monotonic() - started,
+                            'last_modified': None,
+                            'active': record.active
+                            }
+
+    start_time = time.monotonic()
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = [executor.submit(worker, user_rank, record)
+                   for user_rank, record in users_disabled.items()]
+
+        for done, future in enumerate(as_completed(futures), start=1):
+            user_rank, outcome = future.result()
+            outcomes[user_rank] = outcome
+            if on_outcome:
+                on_outcome(user_rank, outcome)
+            if progress:
+                print(f"   Disabling users... {done}/{len(futures)}", end=' '*10+'\r', file=sys.stderr, flush=True)
+
+    if progress:
+        print(' '*94, end='\r', file=sys.stderr, flush=True)
+
+    return outcomes, time.monotonic() - start_time
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+# print per-user outcomes and throughput
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def print_outcomes(users_disabled, outcomes, elapsed, details=True):
+
+    renderer = Renderer()
+    renderer.write(f"\n\n{'#':<5} {'user':<40} {'outcome':<10} {'latency/ms':<12} {'ocid':<40} {'error'}")
+
+    latencies = []
+    failed = 0
+
+    for user_rank in sorted(outcomes):
+        record = users_disabled[user_rank]
+        outcome = outcomes[user_rank]
+        color = red if outcome['status'] == 'Disabled' else yellow
+        failed += outcome['status'] != 'Disabled'
+        latencies.append(outcome['latency'])
+
+        ocid = record.ocid if details else "..." + record.ocid[-10:]
+        latency = f"{outcome['latency'] * 1000:.0f}"
+        renderer.write(color(
+            f"{user_rank:<5} "
+            f"{record.name[0:40]:<40} "
+            f"{outcome['status']:<10} "
+            f"{latency:<12} "
+            f"{ocid:<40} "
+            f"{outcome['error']}"
+        ))
+
+    renderer.flush()
+
+    if not latencies:
+        return
+
+    latencies.sort()
+    throughput = len(latencies) / elapsed if elapsed else 0
+    p50 = latencies[len(latencies) // 2] * 1000
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000
+
+    color = green if not failed else yellow
+    print(color(f"\n{'':<5} {len(latencies) - failed} disabled, {failed} failed in {elapsed:.1f}s "
+                f"({throughput:.1f} users/s, p50 {p50:.0f} ms, p99 {p99:.0f} ms)"))
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+# SCIM Bulk helpers
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+BULK_REQUEST_SCHEMA = "urn:ietf:params:scim:api:messages:2.0:BulkRequest"
+PATCH_OP_SCHEMA = "urn:ietf:params:scim:api:messages:2.0:PatchOp"
+
+def bulk_operation(user_rank, user_ocid):
+    return {
+            'method': 'PATCH',
+            'path': f'/Users/{user_ocid}',
+            'bulkId': str(user_rank),
+            'data': {
+                    'schemas': [PATCH_OP_SCHEMA],
+                    'Operations': [{'op': 'replace', 'path': 'active', 'value': False}]
+                    }
+            }
+
+def bulk_status(operation):
+    # SCIM returns the status as a string, some servers as {'code': ...}
+    status = operation.get('status')
+    if isinstance(status, dict):
+        status = status.get('code')
+    try:
+        return int(status)
+    except (TypeError, ValueError):
+        return 0
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+# disable users through the /admin/v1/Bulk endpoint
+# the request is signed with the oci signer and sent
+# raw, so per-operation status codes can be read back
+# operations failed with a 429, 5xx or transport
+# error are re-queued up to max_rounds, a throttled
+# batch backs off and is counted as a bulk retry
+# output - {rank: outcome} like disable_users
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def disable_users_bulk(endpoint, signer, users_disabled, batch_size=50, max_rounds=3, rate=10, progress=True, session=None, on_outcome=None):
+
+    session = session or requests.Session()
+    url = endpoint.rstrip('/') + '/admin/v1/Bulk'
+    bucket = TokenBucket(rate)
+    outcomes = {}
+    queue = list(users_disabled)
+    start_time = time.monotonic()
+
+    for attempt in range(1, max_rounds + 1):
+        if not queue:
+            break
+        requeue = []
+
+        for offset in range(0, len(queue), batch_size):
+            batch = queue[offset:offset + batch_size]
+            payload = {
+                    'schemas': [BULK_REQUEST_SCHEMA],
+                    'failOnErrors': len(batch),
+                    'Operations': [bulk_operation(rank, users_disabled[rank].ocid) for rank in batch]
+                    }
+
+            bucket.acquire()
+            started = time.monotonic()
+            results = {}
+            batch_error = 'no status returned'
+            try:
+                response = session.post(url, json=payload, auth=signer, timeout=60)
+                METRICS.observe('bulk', time.monotonic() - started,
+                                error=response.status_code >= 400, received=len(response.content))
+                if response.status_code == 429 or response.status_code >= 500:
+                    batch_error = f"{response.status_code} bulk request rejected"
+                else:
+                    response.raise_for_status()
+                    results = {op.get('bulkId'): op for op in response.json().get('Operations', [])}
+            except Exception as error:
+                # raise_for_status messages start with the status code
+                batch_error = str(error)
+            latency = time.monotonic() - started
+
+            if not results and retryable(batch_error) and attempt < max_rounds:
+                # whole batch throttled or failed, back off before re-queueing it
+                METRICS.retry('bulk')
+                time.sleep(min(30, 2 ** attempt))
+
+            for rank in batch:
+                operation = results.get(str(rank), {})
+                status = bulk_status(operation)
+                body = operation.get('response') or {}
+
+                if 200 <= status < 300:
+                    outcomes[rank] = {
+                                    'status': 'Disabled',
+                                    'error': '',
+                                    'latency': latency,
+                                    'last_modified': (body.get('meta') or {}).get('lastModified', '-'),
+                                    'active': bool(body.get('active'))
+                                    }
+                else:
+                    detail = (body.get('detail') or batch_error) if operation else batch_error
+                    outcomes[rank] = {
+                                    'status': 'Failed',
+                                    'error': f"{status} {detail}" if status else detail,
+                                    'latency': latency,
+                                    'last_modified': None,
+                                    'active': users_disabled[rank].active
+                                    }
+                    # 404, 400 and other permanent failures are final
+                    if retryable(outcomes[rank]['error']) and attempt < max_rounds:
+                        requeue.append(rank)
+                        continue
+
+                if on_outcome:
+                    on_outcome(rank, outcomes[rank])
+
+            if progress:
+                done = len(outcomes) - len(requeue)
+                print(f"   Disabling users (bulk)... round {attempt} {done}/{len(users_disabled)}", end=' '*10+'\r', file=sys.stderr, flush=True)
+
+        queue = requeue
+
+    if progress:
+        print(' '*94, end='\r', file=sys.stderr, flush=True)
+
+    return outcomes, time.monotonic() - start_time
@@ -0,0 +1,135 @@
+# coding: utf-8
+
+import oci
+import oci.identity
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from modules.identity import get_client
+from modules.utils import green, yellow, red, path_expander, print_error
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+# read IAM Domains from a file
+# one 'endpoint [config_profile]' pair per line,
+# blank lines and lines starting with # are skipped
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def read_domains_file(path, default_profile):
+
+    domains = []
+
+    try:
+        with open(path_expander(path), 'r') as domains_file:
+            for line in domains_file:
+                line = line.split('#', 1)[0].strip()
+                if not line:
+                    continue
+                parts = line.split()
+                domains.append((parts[0], parts[1] if len(parts) > 1 else default_profile))
+
+    except OSError as e:
+        print_error("Domains file error:", path, e)
+        raise SystemExit(1)
+
+    return domains
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+# discover IAM Domains of the tenancy
+# lists active domains in the root compartment and
+# in every active sub-compartment
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def discover_domains(config, signer):
+
+    identity_client = get_client(oci.identity.IdentityClient, config, signer)
+    tenancy_id = config['tenancy']
+
+    try:
+        compartments = oci.pagination.list_call_get_all_results(
+                                                                identity_client.list_compartments,
+                                                                tenancy_id,
+                                                                compartment_id_in_subtree=True,
+                                                                lifecycle_state='ACTIVE'
+                                                                ).data
+
+        urls = []
+        for compartment_id in [tenancy_id] + [compartment.id for compartment in compartments]:
+            domains = oci.pagination.list_call_get_all_results(
+                                                            identity_client.list_domains,
+                                                            compartment_id,
+                                                            lifecycle_state='ACTIVE'
+                                                            ).data
+            urls.extend(domain.url for domain in domains)
+
+    except oci.exceptions.ServiceError as e:
+        print_error("Domains discovery error:", tenancy_id, e.code, e.message)
+        raise SystemExit(1)
+
+    return urls
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+# run IAM Domains concurrently
+# input - run(endpoint, profile) callable returning
+#         summary counters, list of (endpoint, profile)
+# output - list of summaries in input order
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def run_domains(run, domains, max_domains=4):
+
+    results = {}
+
+    with ThreadPoolExecutor(max_workers=max(1, max_domains)) as executor:
+        futures = {executor.submit(run, endpoint, profile): (index, endpoint)
+                   for index, (endpoint, profile) in enumerate(domains)}
+
+        for future in as_completed(futures):
+            index, endpoint = futures[future]
+            try:
+                results[index] = future.result()
+                results[index]['error'] = ''
+            except (Exception, SystemExit) as e:
+                # SystemExit raised by helpers must not stop the other domains
+                results[index] = {
+                                'endpoint': endpoint,
+                                'active': 0,
+                                'disabled': 0,
+                                'inactive': 0,
+                                'dormant': 0,
+                                'failed': 0,
+                                'error': 'aborted' if isinstance(e, SystemExit) else str(e) or type(e).__name__
+                                }
+            print(f"   Domains completed... {len(results)}/{len(domains)}", end=' '*10+'\r', flush=True)
+
+    print(' '*94, end='\r', flush=True)
+
+    return [results[index] for index in sorted(results)]
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+# print per-domain results
+# output - merged summary counters
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def print_domains_summary(results):
+
+    merged = {'active': 0, 'disabled': 0, 'inactive': 0, 'dormant': 0, 'failed': 0, 'exempt': 0}
+    filtered = False
+
+    print(f"{'domain':<60} {'active':<8} {'disabled':<9} {'inactive':<9} {'dormant':<8} {'failed':<7} {'error'}")
+
+    for result in results:
+        color = red if result['error'] else yellow if result['failed'] else green
+        # -filter fetches only candidates, active & disabled users are not counted
+        active, disabled = ('n/a', 'n/a') if result.get('filtered') else (result['active'], result['disabled'])
+        filtered = filtered or bool(result.get('filtered'))
+        print(color(
+            f"{result['endpoint'][0:60]:<60} "
+            f"{active:<8} "
+            f"{disabled:<9} "
+            f"{result['inactive']:<9} "
+            f"{result['dormant']:<8} "
+            f"{result['failed']:<7} "
+            f"{result['error'][0:60]}"
+        ))
+        for key in merged:
+            merged[key] += result.get(key, 0)
+
+    merged['filtered'] = filtered
+    return merged
@@ -1,8 +1,14 @@
 # coding: utf-8
 
 import oci
+import oci.identity
 import os
-from modules.utils import green, print_error, print_info
+import json
+import time
+import threading
+import requests
+from modules.utils import green, print_error, print_info, path_expander
+from modules.metrics import METRICS
 
 # - - - - - - - - - - - - - - - - - - - - - - - - - -
 # set custom retry strategy
@@ -17,15 +23,91 @@ custom_retry_strategy = oci.retry.RetryStrategyBuilder(
                             retry_base_sleep_time_seconds=2,
                             ).get_retry_strategy()
 
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+# shared oci client factory
+# clients are cached per class, endpoint and signer,
+# all clients of an endpoint share one keep-alive
+# session whose pool holds pool_size connections,
+# set it to the number of parallel workers
+# https always goes through the sdk adapter, whether
+# the session is first created for a sdk client or
+# for the raw json & bulk calls
+# when a sdk client resets its session after a
+# connection error, it closes the shared session and
+# keeps a shallow copy of it: the pools of every client
+# of the endpoint are emptied and refill on the next
+# calls, the copy still shares the same adapters
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+POOL_SIZE = 10
+
+# sdk https transport adapter, older sdks mount none
+HTTPS_ADAPTER = getattr(oci.base_client, 'OCIHTTPAdapter', requests.adapters.HTTPAdapter)
+
+clients = {}
+sessions = {}
+clients_lock = threading.Lock()
+
+def set_pool_size(pool_size):
+    global POOL_SIZE
+    POOL_SIZE = max(1, pool_size)
+
+def get_session(endpoint):
+
+    with clients_lock:
+        session = sessions.get(endpoint)
+        if session is None:
+            session = requests.Session()
+            # the sdk https adapter carries oci specific transport behavior
+            session.mount('https://', HTTPS_ADAPTER(pool_connections=4, pool_maxsize=POOL_SIZE))
+            session.mount('http://', requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=POOL_SIZE))
+            sessions[endpoint] = session
+    return session
+
+def new_client(client_class, config, signer, service_endpoint=None):
+
+    kwargs = {'signer': signer}
+    if service_endpoint:
+        kwargs['service_endpoint'] = service_endpoint
+    client = client_class(config, **kwargs)
+
+    base_client = client.base_client
+    session = get_session(base_client.endpoint)
+    base_client.session.close()
+    base_client.session = session
+
+    return client
+
+# drop the clients & sessions inherited by a forked
+# worker process, connections are not shared across
+# processes
+def reset_clients():
+    global clients_lock
+    clients_lock = threading.Lock()
+    clients.clear()
+    sessions.clear()
+
+def get_client(client_class, config, signer, service_endpoint=None):
+
+    key = (client_class, service_endpoint or config.get('region'), id(signer))
+    with clients_lock:
+        client = clients.get(key)
+    if client is None:
+        client = new_client(client_class, config, signer, service_endpoint)
+        with clients_lock:
+            client = clients.setdefault(key, client)
+    return client
+
 # - - - - - - - - - - - - - - - - - - - - - - - - - -
 # get tenancy name
 # - - - - - - - - - - - - - - - - - - - - - - - - - -
 
 def get_tenancy(tenancy_id, config, signer):
 
-    identity = oci.identity.IdentityClient(config=config, signer=signer)
+    identity = get_client(oci.identity.IdentityClient, config, signer)
     try:
-        tenancy = identity.get_tenancy(tenancy_id)
+        with METRICS.timed('get_tenancy'):
+            tenancy = identity.get_tenancy(tenancy_id)
         home_region_key = f'home region: {tenancy.data.home_region_key}'
     except oci.exceptions.ServiceError as e:
         print_error("Tenancy error:", tenancy_id, e.code, e.message)
@@ -33,13 +115,65 @@ def get_tenancy(tenancy_id, config, signer):
 
     return tenancy.data.name, home_region_key
 
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+# get tenancy name from a local cache
+# the tenancy name rarely changes, it is cached per
+# tenancy ocid and refreshed once ttl has elapsed
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+TENANCY_CACHE = '~/.oci/idleuser_tenancy_cache.json'
+
+def get_tenancy_cached(tenancy_id, config, signer, ttl=86400, cache_path=TENANCY_CACHE):
+
+    cache_path = path_expander(cache_path)
+
+    try:
+        with open(cache_path, 'r') as cache_file:
+            cache = json.load(cache_file)
+    except (OSError, ValueError):
+        cache = {}
+
+    entry = cache.get(tenancy_id)
+    if entry and time.time() - entry.get('fetched', 0) < ttl:
+        return entry['name'], entry['home_region_key']
+
+    tenancy_name, home_region_key = get_tenancy(tenancy_id, config, signer)
+    cache[tenancy_id] = {'name': tenancy_name, 'home_region_key': home_region_key, 'fetched': time.time()}
+
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        with open(cache_path, 'w') as cache_file:
+            json.dump(cache, cache_file)
+    except OSError:
+        pass
+
+    return tenancy_name, home_region_key
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+# validate signer with an ObjectStorage call
+# skipped in fast mode, credentials are then checked
+# by the first Identity Domains call
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def validate_signer(config, signer, fast):
+
+    if fast:
+        return
+
+    import oci.object_storage
+    get_client(oci.object_storage.ObjectStorageClient, config, signer).get_namespace()
+
+def tenancy_lookup(fast):
+    return get_tenancy_cached if fast else get_tenancy
+
 # - - - - - - - - - - - - - - - - - - - - - - - - - -
 # create signer for Authentication
 # input - config_profile and is_instance_principals and is_delegation_token
+#         fast skips validation calls and caches the tenancy name
 # output - config and signer objects
 # - - - - - - - - - - - - - - - - - - - - - - - - - -
 
-def create_signer(config_file_path, config_profile, is_delegation_token, is_config_file):
+def create_signer(config_file_path, config_profile, is_delegation_token, is_config_file, fast=False):
 
     # --------------------------------
     # Config File authentication
@@ -58,12 +192,12 @@ def create_signer(config_file_path, config_profile, is_delegation_token, is_conf
                 private_key_content=config.get('key_content')
             )
             # try getting namespace to validate config
-            oci.object_storage.ObjectStorageClient(config=config, signer=signer).get_namespace()
+            validate_signer(config, signer, fast)
 
             print_info(green, 'Login', 'success', 'config_file')
             print_info(green, 'Login', 'profile', config_profile)
 
-            oci_tname, oci_tregion = get_tenancy(config['tenancy'], config, signer)
+            oci_tname, oci_tregion = tenancy_lookup(fast)(config['tenancy'], config, signer)
             print_info(green, 'Tenancy', oci_tname, oci_tregion)
 
             return config, signer, oci_tname
@@ -93,12 +227,12 @@ def create_signer(config_file_path, config_profile, is_delegation_token, is_conf
                 signer = oci.auth.signers.InstancePrincipalsDelegationTokenSigner(delegation_token=delegation_token)
 
             # try getting namespace to validate config
-            oci.object_storage.ObjectStorageClient(config=config, signer=signer).get_namespace()
+            validate_signer(config, signer, fast)
 
             print_info(green, 'Login', 'success', 'delegation_token')
             print_info(green, 'Login', 'token', delegation_token_location)
 
-            oci_tname, oci_tregion = get_tenancy(config['tenancy'], config, signer)
+            oci_tname, oci_tregion = tenancy_lookup(fast)(config['tenancy'], config, signer)
             print_info(green, 'Tenancy', oci_tname, oci_tregion)
 
             return config, signer, oci_tname
@@ -119,10 +253,10 @@ def create_signer(config_file_path, config_profile, is_delegation_token, is_conf
             signer = oci.auth.signers.InstancePrincipalsSecurityTokenSigner(retry_strategy=custom_retry_strategy)
             config = {'region': signer.region, 'tenancy': signer.tenancy_id}
           
-            oci_tname, oci_tregion = get_tenancy(config['tenancy'], config, signer)
+            oci_tname, oci_tregion = tenancy_lookup(fast)(config['tenancy'], config, signer)
 
             # try getting namespace to validate config
-            oci.object_storage.ObjectStorageClient(config=config, signer=signer).get_namespace()
+            validate_signer(config, signer, fast)
 
             print_info(green, 'Login', 'success', 'instance_principals')
             print_info(green, 'Tenancy', oci_tname, oci_tregion)
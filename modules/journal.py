@@ -0,0 +1,147 @@
+# coding: utf-8
+
+import os
+import json
+import time
+import threading
+from datetime import datetime, timezone
+from modules.classifier import UserRecord, State
+from modules.disabler import retryable
+from modules.utils import yellow, path_expander, print_error
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+# write-ahead journal of status changes
+# append-only JSON Lines, one 'plan' entry per user
+# to disable, fsynced before the first call, then one
+# 'done' entry per outcome, fsynced every batch_size
+# entries or interval seconds
+# the journal is kept as an audit trail
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+class Journal:
+
+    def __init__(self, path, batch_size=100, interval=1.0):
+        self.path = path_expander(path)
+        self.batch_size = batch_size
+        self.interval = interval
+        self.run = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S")
+        self.lock = threading.Lock()
+        self.unsynced = 0
+        self.synced = time.monotonic()
+
+        try:
+            self.stream = open(self.path, 'a', encoding='utf-8')
+        except OSError as e:
+            print_error("Journal error:", path, e)
+            raise SystemExit(1)
+
+    def append(self, entry):
+        entry['run'] = self.run
+        entry['ts'] = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+        self.stream.write(json.dumps(entry, separators=(',', ':')))
+        self.stream.write('\n')
+        self.unsynced += 1
+
+    def sync(self):
+        # caller holds the lock
+        self.stream.flush()
+        os.fsync(self.stream.fileno())
+        self.unsynced = 0
+        self.synced = time.monotonic()
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - -
+    # journal the planned status changes
+    # input - endpoint, users_disabled {rank: UserRecord}
+    # - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    def plan(self, endpoint, users_disabled):
+        with self.lock:
+            for record in users_disabled.values():
+                self.append({
+                            'op': 'plan',
+                            'endpoint': endpoint,
+                            'ocid': record.ocid,
+                            'name': record.name,
+                            'state': record.state.value,
+                            'days': record.days,
+                            'last_login': record.last_login,
+                            'domain': record.domain,
+                            'created': record.created
+                            })
+            self.sync()
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - -
+    # journal the outcome of one status change
+    # - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    def complete(self, endpoint, record, outcome):
+        with self.lock:
+            self.append({
+                        'op': 'done',
+                        'endpoint': endpoint,
+                        'ocid': record.ocid,
+                        'status': outcome['status'],
+                        'error': outcome['error']
+                        })
+            if self.unsynced >= self.batch_size or time.monotonic() - self.synced >= self.interval:
+                self.sync()
+
+    def close(self):
+        with self.lock:
+            self.sync()
+            self.stream.close()
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+# planned status changes not completed yet
+# only the plans of the latest run of the endpoint
+# are pending, older plans were superseded by it
+# a user is pending until a 'done' entry closes it,
+# changes failed on 429, 5xx or transport errors
+# stay pending, other failures are final
+# a truncated last line, left by a crash, is skipped
+# output - {rank: UserRecord} in plan order
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def read_pending(path, endpoint):
+
+    pending = {}
+    latest_run = None
+
+    try:
+        with open(path_expander(path), 'r', encoding='utf-8') as journal_file:
+            for line in journal_file:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    print_error("Journal line skipped:", path, line.strip()[0:60], color=yellow, level='WARNING')
+                    continue
+                if entry.get('endpoint') != endpoint:
+                    continue
+                if entry.get('op') == 'plan':
+                    if entry.get('run') != latest_run:
+                        latest_run = entry.get('run')
+                        pending = {}
+                    pending[entry['ocid']] = entry
+                elif entry.get('op') == 'done':
+                    if entry.get('status') != 'Failed' or not retryable(entry.get('error')):
+                        pending.pop(entry['ocid'], None)
+
+    except FileNotFoundError:
+        return {}
+    except OSError as e:
+        print_error("Journal error:", path, e)
+        raise SystemExit(1)
+
+    return {
+            rank: UserRecord(
+                            entry['ocid'],
+                            entry['name'],
+                            True,
+                            State(entry['state']),
+                            entry.get('days'),
+                            entry.get('last_login'),
+                            entry.get('domain'),
+                            entry.get('created')
+                            )
+            for rank, entry in enumerate(pending.values(), start=1)
+            }
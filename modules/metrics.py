@@ -0,0 +1,265 @@
+# coding: utf-8
+
+import os
+import time
+import random
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# latency histogram buckets in seconds
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# latencies sampled per operation for the percentiles
+RESERVOIR_SIZE = 1024
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+# run-level performance metrics
+# per operation: latency histogram, errors, retries
+# and bytes received, thread safe so worker pools can
+# record, memory stays bounded in daemon mode:
+# latencies are counted in buckets and a reservoir
+# sample of them gives the percentiles
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+class Metrics:
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        # also called by forked worker processes
+        self.lock = threading.Lock()
+        self.operations = {}
+        self.phases = {}
+
+    def operation(self, name):
+        # caller holds the lock
+        if name not in self.operations:
+            self.operations[name] = {'calls': 0, 'errors': 0, 'retries': 0, 'bytes': 0, 'sum': 0,
+                                     'buckets': [0] * (len(LATENCY_BUCKETS) + 1), 'latencies': []}
+        return self.operations[name]
+
+    def observe(self, name, seconds, error=False, received=0):
+        with self.lock:
+            operation = self.operation(name)
+            operation['calls'] += 1
+            operation['errors'] += int(bool(error))
+            operation['bytes'] += received or 0
+            operation['sum'] += seconds
+            operation['buckets'][bisect_left(LATENCY_BUCKETS, seconds)] += 1
+
+            # reservoir sampling, every call has the same chance to be kept
+            latencies = operation['latencies']
+            if len(latencies) < RESERVOIR_SIZE:
+                latencies.append(seconds)
+            else:
+                slot = random.randrange(operation['calls'])
+                if slot < RESERVOIR_SIZE:
+                    latencies[slot] = seconds
+
+    def retry(self, name):
+        with self.lock:
+            self.operation(name)['retries'] += 1
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - -
+    # time a block of code as an operation or a phase
+    # - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    @contextmanager
+    def timed(self, name):
+        started = time.monotonic()
+        error = False
+        try:
+            yield
+        except BaseException:
+            error = True
+            raise
+        finally:
+            self.observe(name, time.monotonic() - started, error)
+
+    @contextmanager
+    def phase(self, name):
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.record_phase(name, time.monotonic() - started)
+
+    def record_phase(self, name, seconds):
+        with self.lock:
+            self.phases[name] = self.phases.get(name, 0) + seconds
+
+    # merge the operations recorded by a worker process
+    # reservoirs are resampled in proportion to calls
+    def merge(self, operations):
+        with self.lock:
+            for name, other in operations.items():
+                operation = self.operation(name)
+                calls = operation['calls'] + other['calls']
+                latencies = operation['latencies'] + other['latencies']
+                if len(latencies) > RESERVOIR_SIZE:
+                    own = round(RESERVOIR_SIZE * operation['calls'] / calls)
+                    own = max(RESERVOIR_SIZE - len(other['latencies']), min(own, len(operation['latencies'])))
+                    latencies = (random.sample(operation['latencies'], own) +
+                                 random.sample(other['latencies'], RESERVOIR_SIZE - own))
+                for key in ('calls', 'errors', 'retries', 'bytes', 'sum'):
+                    operation[key] += other[key]
+                operation['buckets'] = [count + other_count for count, other_count in zip(operation['buckets'], other['buckets'])]
+                operation['latencies'] = latencies
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - -
+    # wrap an oci sdk call
+    # bytes are read from the content-length header
+    # - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    def wrap(self, name, func):
+
+        def wrapper(*args, **kwargs):
+            started = time.monotonic()
+            try:
+                response = func(*args, **kwargs)
+            except Exception:
+                self.observe(name, time.monotonic() - started, error=True)
+                raise
+            headers = getattr(response, 'headers', None) or {}
+            self.observe(name, time.monotonic() - started, received=int(headers.get('content-length', 0) or 0))
+            return response
+
+        wrapper.__name__ = getattr(func, '__name__', name)
+        return wrapper
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - -
+    # snapshot of the metrics with percentiles
+    # percentiles are read from the reservoir sample,
+    # buckets are cumulative like Prometheus le buckets
+    # - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    def snapshot(self):
+
+        with self.lock:
+            operations = {name: dict(operation, latencies=sorted(operation['latencies']), buckets=list(operation['buckets']))
+                          for name, operation in self.operations.items()}
+            phases = dict(self.phases)
+
+        for operation in operations.values():
+            latencies = operation['latencies']
+            count = len(latencies)
+            operation['p50'] = latencies[count // 2] if count else 0
+            operation['p99'] = latencies[min(count - 1, int(count * 0.99))] if count else 0
+            cumulative = 0
+            for index, bucket in enumerate(operation['buckets'][:len(LATENCY_BUCKETS)]):
+                cumulative += bucket
+                operation['buckets'][index] = cumulative
+            del operation['buckets'][len(LATENCY_BUCKETS):]
+
+        return operations, phases
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - -
+    # print timing breakdown
+    # - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    def print_report(self):
+
+        operations, phases = self.snapshot()
+
+        print('  - Timing Breakdown:')
+        for name, seconds in phases.items():
+            print(f'{" ":<5} {"* " + name + ":":<26} {seconds:>9.2f} s')
+
+        print(f'\n{" ":<5} {"call":<26} {"calls":>7} {"errors":>7} {"retries":>8} {"total s":>9} {"p50/ms":>8} {"p99/ms":>8} {"KiB":>9}')
+        for name, operation in operations.items():
+            print(f'{" ":<5} {name:<26} '
+                  f'{operation["calls"]:>7} '
+                  f'{operation["errors"]:>7} '
+                  f'{operation["retries"]:>8} '
+                  f'{operation["sum"]:>9.2f} '
+                  f'{operation["p50"] * 1000:>8.0f} '
+                  f'{operation["p99"] * 1000:>8.0f} '
+                  f'{operation["bytes"] / 1024:>9.1f}')
+        print()
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - -
+    # export as Prometheus textfile or OpenMetrics
+    # written atomically for the node_exporter
+    # textfile collector, render returns the text
+    # - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    def export(self, path, openmetrics=False, prefix='oci_idleuser'):
+
+        temporary = f'{path}.{os.getpid()}.tmp'
+        with open(temporary, 'w') as metrics_file:
+            metrics_file.write(self.render(openmetrics, prefix))
+        os.replace(temporary, path)
+
+    def render(self, openmetrics=False, prefix='oci_idleuser'):
+
+        operations, phases = self.snapshot()
+        lines = []
+
+        def family(name, kind, help_text):
+            lines.append(f'# HELP {prefix}_{name} {help_text}')
+            lines.append(f'# TYPE {prefix}_{name} {kind}')
+
+        family('call_duration_seconds', 'histogram', 'Latency of OCI calls.')
+        for name, operation in operations.items():
+            for bound, count in zip(LATENCY_BUCKETS, operation['buckets']):
+                lines.append(f'{prefix}_call_duration_seconds_bucket{{call="{name}",le="{bound}"}} {count}')
+            lines.append(f'{prefix}_call_duration_seconds_bucket{{call="{name}",le="+Inf"}} {operation["calls"]}')
+            lines.append(f'{prefix}_call_duration_seconds_sum{{call="{name}"}} {operation["sum"]:.6f}')
+            lines.append(f'{prefix}_call_duration_seconds_count{{call="{name}"}} {operation["calls"]}')
+
+        family('call_latency_seconds', 'summary', 'Latency quantiles of OCI calls.')
+        for name, operation in operations.items():
+            lines.append(f'{prefix}_call_latency_seconds{{call="{name}",quantile="0.5"}} {operation["p50"]:.6f}')
+            lines.append(f'{prefix}_call_latency_seconds{{call="{name}",quantile="0.99"}} {operation["p99"]:.6f}')
+            lines.append(f'{prefix}_call_latency_seconds_sum{{call="{name}"}} {operation["sum"]:.6f}')
+            lines.append(f'{prefix}_call_latency_seconds_count{{call="{name}"}} {operation["calls"]}')
+
+        # OpenMetrics counter families are named without the _total suffix
+        for metric, key, help_text in [('call_errors', 'errors', 'Failed OCI calls.'),
+                                       ('call_retries', 'retries', 'Retried OCI calls.'),
+                                       ('received_bytes', 'bytes', 'Bytes received from OCI calls.')]:
+            family(metric if openmetrics else f'{metric}_total', 'counter', help_text)
+            for name, operation in operations.items():
+                lines.append(f'{prefix}_{metric}_total{{call="{name}"}} {operation[key]}')
+
+        family('phase_duration_seconds', 'gauge', 'Wall time spent in each run phase.')
+        for name, seconds in phases.items():
+            lines.append(f'{prefix}_phase_duration_seconds{{phase="{name}"}} {seconds:.6f}')
+
+        if openmetrics:
+            lines.append('# EOF')
+
+        return '\n'.join(lines) + '\n'
+
+METRICS = Metrics()
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+# retry strategy counting retries
+# wraps an oci retry strategy such as
+# custom_retry_strategy, each extra attempt of the
+# wrapped call is recorded as a retry
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+class RetryCounter:
+
+    def __init__(self, strategy, name, metrics=METRICS):
+        self.strategy = strategy
+        self.name = name
+        self.metrics = metrics
+
+    def make_retrying_call(self, func_ref, *args, **kwargs):
+
+        attempts = [0]
+
+        def attempt(*call_args, **call_kwargs):
+            attempts[0] += 1
+            if attempts[0] > 1:
+                self.metrics.retry(self.name)
+            return func_ref(*call_args, **call_kwargs)
+
+        return self.strategy.make_retrying_call(attempt, *args, **kwargs)
+
+    def __getattr__(self, attribute):
+        return getattr(self.strategy, attribute)
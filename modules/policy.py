@@ -0,0 +1,171 @@
+# coding: utf-8
+
+import re
+import sys
+import json
+import time
+import fnmatch
+from datetime import datetime, timedelta, timezone
+from modules.classifier import login_state
+from modules.metrics import METRICS
+from modules.users import call_with_backoff, print_progress
+from modules.utils import path_expander, print_error
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+# policy file, json
+#
+# {
+#   "exempt_users": ["breakglass*", "svc-*@example.com"],
+#   "exempt_groups": ["Administrators"],
+#   "grace_days": 14,
+#   "group_days": {"Contractors": 30, "Auditors": 180}
+# }
+#
+# exempt_users  - userName patterns, case insensitive
+# exempt_groups - members are never disabled
+# grace_days    - users created less than grace_days
+#                 ago are never disabled
+# group_days    - -days override for group members,
+#                 the most lenient override applies
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+POLICY_KEYS = {'exempt_users', 'exempt_groups', 'grace_days', 'group_days'}
+
+def read_policy(path):
+
+    try:
+        with open(path_expander(path), 'r') as policy_file:
+            policy = json.load(policy_file)
+    except (OSError, ValueError) as e:
+        print_error("Policy file error:", path, e)
+        raise SystemExit(1)
+
+    unknown = set(policy) - POLICY_KEYS
+    if unknown:
+        print_error("Policy file error:", path, f"unknown keys: {', '.join(sorted(unknown))}")
+        raise SystemExit(1)
+
+    return policy
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+# list groups with their members
+# paged like list_users_paged, a filter limits the
+# call to the groups named in the policy
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def list_groups_paged(identity_domain_client, page_size=1000, progress=True, **kwargs):
+
+    kwargs.setdefault('attributes', "displayName,members")
+
+    start_index = 1
+    pages = 0
+    fetched = 0
+    start_time = time.monotonic()
+
+    while True:
+        response = call_with_backoff(METRICS.wrap('list_groups', identity_domain_client.list_groups),
+                                     start_index=start_index,
+                                     count=page_size,
+                                     **kwargs)
+        resources = response.data.resources or []
+        total_results = response.data.total_results
+
+        pages += 1
+        fetched += len(resources)
+
+        if progress:
+            print_progress(pages, fetched, start_time, total_results, resource='groups')
+
+        for group in resources:
+            yield group
+
+        if not resources or (total_results is not None and fetched >= total_results):
+            break
+
+        start_index += len(resources)
+
+    if progress:
+        print(' '*94, end='\r', file=sys.stderr, flush=True)
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+# exemption & override policy
+# compiled once, then evaluated in O(1) per user from
+# an in-memory user ocid -> group names index
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+class Policy:
+
+    def __init__(self, policy, days_history, now=None):
+
+        now = now or datetime.now(timezone.utc)
+        self.days_history = days_history
+
+        patterns = policy.get('exempt_users') or []
+        self.user_pattern = re.compile('|'.join(fnmatch.translate(pattern) for pattern in patterns), re.IGNORECASE) if patterns else None
+
+        # group names as written in the policy file, for the SCIM filter,
+        # and lowercased to match group displayNames case insensitively
+        self.policy_groups = list(dict.fromkeys(list(policy.get('exempt_groups') or []) + list(policy.get('group_days') or {})))
+        self.exempt_groups = {group.lower() for group in policy.get('exempt_groups') or []}
+        self.group_days = {group.lower(): int(days) for group, days in (policy.get('group_days') or {}).items()}
+
+        # created timestamps are ISO 8601 strings, a string comparison is enough
+        grace_days = policy.get('grace_days') or 0
+        self.grace_cutoff = (now - timedelta(days=grace_days)).strftime("%Y-%m-%dT%H:%M:%S.000Z") if grace_days else None
+
+        self.groups = {}
+
+    @property
+    def group_names(self):
+        return self.exempt_groups | set(self.group_days)
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - -
+    # build the user ocid -> group names index
+    # members are indexed by ocid and by id
+    # - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    def load_groups(self, identity_domain_client, page_size=1000, progress=True):
+
+        if not self.group_names:
+            return
+
+        scim_filter = ' or '.join(f'displayName eq "{name}"' for name in self.policy_groups)
+        found = set()
+
+        for group in list_groups_paged(identity_domain_client, page_size=page_size, progress=progress, filter=scim_filter):
+            name = (group.display_name or '').lower()
+            found.add(name)
+            for member in group.members or []:
+                if member.type not in (None, 'User'):
+                    continue
+                for key in (member.ocid, member.value):
+                    if key:
+                        self.groups.setdefault(key, set()).add(name)
+
+        missing = [name for name in self.policy_groups if name.lower() not in found]
+        if missing:
+            print_error("Policy groups not found:", ', '.join(missing), level='INFO')
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - -
+    # apply the policy to a classified user
+    # updates the state for group overrides and sets
+    # the exemption reason
+    # - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    def apply(self, record):
+
+        groups = self.groups.get(record.ocid, ())
+
+        if groups and self.group_days:
+            overrides = [self.group_days[group] for group in groups if group in self.group_days]
+            if overrides:
+                record.state = login_state(record.days, max(overrides))
+
+        if self.user_pattern and self.user_pattern.match(record.name or ''):
+            record.exempt = 'userName'
+        elif groups and not self.exempt_groups.isdisjoint(groups):
+            record.exempt = 'group'
+        elif self.grace_cutoff and record.created and record.created > self.grace_cutoff:
+            record.exempt = 'grace'
+
+        return record
@@ -0,0 +1,143 @@
+# coding: utf-8
+
+import io
+import json
+import oci
+from modules.identity import custom_retry_strategy, get_session
+from modules.metrics import RetryCounter
+from modules.users import user_fields, raw_user_fields
+
+# optional faster decoders, orjson parses a page in
+# one C call, ijson streams the resources of a page
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+JSON_DECODER = 'orjson' if orjson else 'ijson' if ijson else 'json'
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+# parse a SCIM list response page
+# input - response body bytes
+# output - list of raw resources, totalResults
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def parse_users_page(content, decoder=JSON_DECODER):
+
+    if decoder == 'ijson':
+        resources = []
+        total_results = None
+        builder = None
+        for prefix, event, value in ijson.parse(io.BytesIO(content)):
+            if prefix == 'totalResults':
+                total_results = int(value)
+            elif prefix == 'Resources.item' and event == 'start_map':
+                builder = ijson.ObjectBuilder()
+            if builder is not None:
+                builder.event(event, value)
+                if prefix == 'Resources.item' and event == 'end_map':
+                    resources.append(builder.value)
+                    builder = None
+        return resources, total_results
+
+    page = orjson.loads(content) if decoder == 'orjson' else json.loads(content)
+    return page.get('Resources') or [], page.get('totalResults')
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+# page of raw resources, read like a sdk list response
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+class RawPage:
+
+    __slots__ = ('resources', 'total_results')
+
+    def __init__(self, resources, total_results):
+        self.resources = resources
+        self.total_results = total_results
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+# raw json list_users
+# signed GET on /admin/v1/Users with the script
+# signer & custom_retry_strategy, resources are kept
+# as parsed dicts instead of sdk User models, read
+# them with raw_user_fields
+# a drop-in for IdentityDomainsClient.list_users in
+# list_users_paged, list_users_parallel & shards
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+# sdk keyword -> SCIM query parameter
+QUERY_PARAMETERS = {
+                    'filter': 'filter',
+                    'sort_by': 'sortBy',
+                    'sort_order': 'sortOrder',
+                    'start_index': 'startIndex',
+                    'count': 'count',
+                    'attributes': 'attributes',
+                    }
+
+class RawUsersClient:
+
+    def __init__(self, endpoint, signer, session=None, timeout=60, decoder=JSON_DECODER):
+        self.url = endpoint.rstrip('/') + '/admin/v1/Users'
+        self.signer = signer
+        self.session = session or get_session(endpoint)
+        self.timeout = timeout
+        self.decoder = decoder
+        self.retry_strategy = RetryCounter(custom_retry_strategy, 'list_users')
+
+    def get(self, params):
+
+        response = self.session.get(self.url, params=params, auth=self.signer, timeout=self.timeout,
+                                    headers={'accept': 'application/json'})
+        if response.status_code >= 400:
+            try:
+                error = response.json()
+            except ValueError:
+                error = {}
+            # raised as a sdk ServiceError so 429 and 5xx are retried
+            raise oci.exceptions.ServiceError(response.status_code,
+                                              error.get('code') or str(response.status_code),
+                                              response.headers,
+                                              error.get('detail') or error.get('message') or response.reason)
+        return response
+
+    def list_users(self, **kwargs):
+
+        params = {QUERY_PARAMETERS[key]: value for key, value in kwargs.items() if value is not None}
+        response = self.retry_strategy.make_retrying_call(self.get, params)
+        resources, total_results = parse_users_page(response.content, self.decoder)
+
+        return oci.response.Response(response.status_code, response.headers, RawPage(resources, total_results), response.request)
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+# compare the raw json path to the sdk path
+# on recorded SCIM resources, such as a snapshot
+# input - raw resources, sdk base client
+# output - [(userName, field, sdk value, raw value)]
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def check_parity(resources, base_client, decoder=JSON_DECODER):
+
+    resources = list(resources)
+    content = json.dumps({'totalResults': len(resources), 'Resources': resources}).encode()
+
+    raw_resources, _ = parse_users_page(content, decoder)
+    sdk_page = base_client.deserialize_response_data(content, 'Users')
+
+    mismatches = []
+    for raw_resource, sdk_user in zip(raw_resources, sdk_page.resources or []):
+        raw = raw_user_fields(raw_resource)
+        sdk = user_fields(sdk_user)
+        for field, value in sdk.items():
+            if raw[field] != value:
+                mismatches.append((sdk['name'], field, value, raw[field]))
+
+    if len(raw_resources) != len(sdk_page.resources or []):
+        mismatches.append(('-', 'count', len(sdk_page.resources or []), len(raw_resources)))
+
+    return mismatches
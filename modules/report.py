@@ -0,0 +1,200 @@
+# coding: utf-8
+
+import csv
+import json
+import threading
+from modules.utils import path_expander, print_error
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+# machine-readable report columns
+# one row per evaluated user, per disable outcome and
+# a final summary row, unused columns are left empty
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+REPORT_COLUMNS = [
+                'type', 'endpoint', 'rank', 'name', 'ocid', 'active', 'state', 'exempt', 'days',
+                'last_login', 'created', 'status', 'error', 'latency_ms',
+                'users_active', 'users_disabled', 'users_inactive', 'users_dormant', 'users_failed', 'users_exempt'
+                ]
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+# base report writer
+# rows are written as soon as users are classified
+# or disabled, nothing is buffered besides the
+# parquet row group, a lock serializes domains
+# running concurrently
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+class ReportWriter:
+
+    def __init__(self, stream, owned=False):
+        self.stream = stream
+        self.owned = owned
+        self.lock = threading.Lock()
+
+    def write_user(self, endpoint, rank, record):
+        self.write({
+                    'type': 'user',
+                    'endpoint': endpoint,
+                    'rank': rank,
+                    'name': record.name,
+                    'ocid': record.ocid,
+                    'active': record.active,
+                    'state': record.state.value,
+                    'exempt': record.exempt,
+                    'days': record.days,
+                    'last_login': record.last_login,
+                    'created': record.created
+                    })
+
+    def write_outcome(self, endpoint, rank, record, outcome):
+        self.write({
+                    'type': 'disable',
+                    'endpoint': endpoint,
+                    'rank': rank,
+                    'name': record.name,
+                    'ocid': record.ocid,
+                    'active': outcome['active'],
+                    'status': outcome['status'],
+                    'error': outcome['error'],
+                    'latency_ms': round(outcome['latency'] * 1000, 1)
+                    })
+
+    def write_threshold(self, threshold, dormant, inactive):
+        self.write({
+                    'type': 'threshold',
+                    'days': threshold,
+                    'users_dormant': len(dormant),
+                    'users_inactive': len(inactive)
+                    })
+        # members of the threshold, one row per user
+        for state, names in (('Dormant', dormant), ('Inactive', inactive)):
+            for name in names:
+                self.write({'type': 'threshold_user', 'days': threshold, 'name': name, 'state': state})
+
+    def write_summary(self, summary):
+        # left empty with -filter, only candidates are fetched
+        filtered = summary.get('filtered')
+        self.write({
+                    'type': 'summary',
+                    'users_active': None if filtered else summary['active'],
+                    'users_disabled': None if filtered else summary['disabled'],
+                    'users_inactive': summary['inactive'],
+                    'users_dormant': summary['dormant'],
+                    'users_failed': summary.get('failed', 0),
+                    'users_exempt': summary.get('exempt', 0)
+                    })
+
+    def write(self, row):
+        with self.lock:
+            self.write_row(row)
+
+    def close(self):
+        with self.lock:
+            self.stream.flush()
+            if self.owned:
+                self.stream.close()
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+# JSON Lines writer
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+class JsonlWriter(ReportWriter):
+
+    def write_row(self, row):
+        self.stream.write(json.dumps(row, separators=(',', ':')))
+        self.stream.write('\n')
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+# CSV writer
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+class CsvWriter(ReportWriter):
+
+    def __init__(self, stream, owned=False):
+        super().__init__(stream, owned)
+        self.writer = csv.DictWriter(stream, fieldnames=REPORT_COLUMNS, extrasaction='ignore')
+        self.writer.writeheader()
+
+    def write_row(self, row):
+        self.writer.writerow(row)
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+# Parquet writer, requires pyarrow
+# rows are flushed as one row group every batch_size
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+class ParquetWriter(ReportWriter):
+
+    def __init__(self, path, batch_size=10000):
+
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            print_error("Parquet output error:", "pyarrow is not installed", "pip3 install pyarrow")
+            raise SystemExit(1)
+
+        self.pa = pyarrow
+        self.schema = pyarrow.schema([
+                                    ('type', pyarrow.string()),
+                                    ('endpoint', pyarrow.string()),
+                                    ('rank', pyarrow.int64()),
+                                    ('name', pyarrow.string()),
+                                    ('ocid', pyarrow.string()),
+                                    ('active', pyarrow.bool_()),
+                                    ('state', pyarrow.string()),
+                                    ('exempt', pyarrow.string()),
+                                    ('days', pyarrow.int64()),
+                                    ('last_login', pyarrow.string()),
+                                    ('created', pyarrow.string()),
+                                    ('status', pyarrow.string()),
+                                    ('error', pyarrow.string()),
+                                    ('latency_ms', pyarrow.float64()),
+                                    ('users_active', pyarrow.int64()),
+                                    ('users_disabled', pyarrow.int64()),
+                                    ('users_inactive', pyarrow.int64()),
+                                    ('users_dormant', pyarrow.int64()),
+                                    ('users_failed', pyarrow.int64()),
+                                    ('users_exempt', pyarrow.int64()),
+                                    ])
+        self.parquet = pyarrow.parquet.ParquetWriter(path, self.schema)
+        self.batch_size = batch_size
+        self.rows = []
+        self.lock = threading.Lock()
+
+    def write_row(self, row):
+        self.rows.append(row)
+        if len(self.rows) >= self.batch_size:
+            self.flush_rows()
+
+    def flush_rows(self):
+        if self.rows:
+            self.parquet.write_table(self.pa.Table.from_pylist(self.rows, schema=self.schema))
+            self.rows = []
+
+    def close(self):
+        with self.lock:
+            self.flush_rows()
+            self.parquet.close()
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+# open a report writer
+# input - format jsonl|csv|parquet, output path or
+#         stream, '-' writes to the given stream
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def open_report(output_format, output_path, stdout):
+
+    if output_format == 'parquet':
+        if output_path in ('', '-'):
+            print_error("Parquet output error:", "parquet needs an output file, use -outfile")
+            raise SystemExit(1)
+        return ParquetWriter(path_expander(output_path))
+
+    if output_path in ('', '-'):
+        stream, owned = stdout, False
+    else:
+        stream, owned = open(path_expander(output_path), 'w', newline='' if output_format == 'csv' else None), True
+
+    return CsvWriter(stream, owned) if output_format == 'csv' else JsonlWriter(stream, owned)
@@ -0,0 +1,179 @@
+# coding: utf-8
+
+import os
+import sys
+import time
+import multiprocessing
+import oci
+import oci.identity_domains
+from concurrent.futures import ProcessPoolExecutor
+from modules.classifier import Classifier, UserRecord, State
+from modules.identity import get_client, reset_clients
+from modules.metrics import METRICS
+from modules.users import list_users_paged, user_fields, raw_user_fields, call_with_backoff
+from modules.rawjson import RawUsersClient
+from modules.utils import green, yellow
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+# state of a worker process
+# workers are forked and inherit the config & signer,
+# nothing is pickled but the shard results, inherited
+# clients, sessions & metrics are dropped
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+worker = {}
+
+def init_worker(config, signer):
+    reset_clients()
+    METRICS.reset()
+    worker['config'] = config
+    worker['signer'] = signer
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+# fetch, deserialize & classify one shard
+# input - (index, endpoint, start_index, stop_index,
+#         page_size, days_history, now, raw)
+# output - shard stats, compact records as tuples in
+#          UserRecord field order, worker metrics
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def evaluate_shard(shard):
+
+    index, endpoint, start_index, stop_index, page_size, days_history, now, raw = shard
+
+    started = time.monotonic()
+    cpu_started = time.process_time()
+
+    if raw:
+        client = RawUsersClient(endpoint, worker['signer'])
+    else:
+        client = get_client(oci.identity_domains.IdentityDomainsClient, worker['config'], worker['signer'], endpoint)
+    fields = raw_user_fields if raw else user_fields
+
+    classifier = Classifier(days_history, now)
+    users = list_users_paged(client, page_size=page_size, progress=False, start_index=start_index, stop_index=stop_index)
+
+    records = [
+                (record.ocid, record.name, record.active, record.state.value, record.days,
+                 record.last_login, record.domain, record.created)
+                for record in classifier.classify_stream((fields(user) for user in users), chunk_size=page_size)
+                ]
+
+    stats = {
+            'index': index,
+            'start': start_index,
+            'stop': stop_index,
+            'users': len(records),
+            'wall': time.monotonic() - started,
+            'cpu': time.process_time() - cpu_started,
+            'pid': os.getpid()
+            }
+
+    with METRICS.lock:
+        operations = METRICS.operations
+
+    return stats, records, operations
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+# sharded evaluation of one IAM Domain
+# the sorted startIndex space is split in contiguous
+# page aligned ranges, one per worker process, so
+# deserialization & classification use every core
+# the last shard is open ended to pick up users
+# created since totalResults was read
+# records are yielded in shard order, which keeps
+# the userName sorting
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+class ShardedEvaluation:
+
+    def __init__(self, config, signer, endpoint, shards=4, page_size=1000, days_history=60, raw=False):
+        self.config = config
+        self.signer = signer
+        self.endpoint = endpoint
+        self.shards = shards
+        self.page_size = page_size
+        self.days_history = days_history
+        self.raw = raw
+        self.stats = []
+        self.elapsed = 0
+
+    def ranges(self, total_results):
+
+        pages = max(1, -(-total_results // self.page_size))
+        shard_pages = -(-pages // self.shards)
+
+        ranges = []
+        for start_page in range(0, pages, shard_pages):
+            start_index = 1 + start_page * self.page_size
+            ranges.append([start_index, start_index + shard_pages * self.page_size - 1])
+        ranges[-1][1] = None
+
+        return ranges
+
+    def records(self, progress=True):
+
+        client = get_client(oci.identity_domains.IdentityDomainsClient, self.config, self.signer, self.endpoint)
+        response = call_with_backoff(METRICS.wrap('list_users', client.list_users), start_index=1, count=1, attributes="ocid")
+        total_results = response.data.total_results or 0
+
+        now = Classifier(self.days_history).now
+        shards = [(index, self.endpoint, start_index, stop_index, self.page_size, self.days_history, now, self.raw)
+                  for index, (start_index, stop_index) in enumerate(self.ranges(total_results), start=1)]
+
+        # fork, the main script has no __main__ guard spawned workers could import
+        context = multiprocessing.get_context('fork')
+        started = time.monotonic()
+        fetched = 0
+
+        with ProcessPoolExecutor(max_workers=len(shards), mp_context=context,
+                                 initializer=init_worker, initargs=(self.config, self.signer)) as executor:
+
+            for stats, records, operations in executor.map(evaluate_shard, shards):
+                self.stats.append(stats)
+                METRICS.merge(operations)
+
+                fetched += stats['users']
+                if progress:
+                    print(f"   Evaluating shards... {stats['index']}/{len(shards)} users: {fetched}/{total_results}",
+                          end=' '*10+'\r', file=sys.stderr, flush=True)
+
+                for ocid, name, active, state, days, last_login, domain, created in records:
+                    yield UserRecord(ocid, name, active, State(state), days, last_login, domain, created)
+
+        self.elapsed = time.monotonic() - started
+
+        if progress:
+            print(' '*94, end='\r', file=sys.stderr, flush=True)
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - -
+    # print per-shard timings & scaling across cores
+    # cores used is the cpu time of all shards over the
+    # wall time of the sharded evaluation, shard wall
+    # times overlap & include network waits, they tell
+    # nothing about the speedup
+    # - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    def print_report(self):
+
+        if not self.stats:
+            return
+
+        print(f'\n  - Shard Scaling ({len(self.stats)} shards, {os.cpu_count()} cores):')
+        print(f'{" ":<5} {"shard":<7} {"startIndex":<22} {"users":>9} {"wall s":>8} {"cpu s":>8} {"users/s":>9}')
+
+        for stats in self.stats:
+            stop = stats['stop'] if stats['stop'] is not None else 'end'
+            rate = stats['users'] / stats['wall'] if stats['wall'] else 0
+            print(f'{" ":<5} {stats["index"]:<7} {str(stats["start"]) + "-" + str(stop):<22} '
+                  f'{stats["users"]:>9} {stats["wall"]:>8.2f} {stats["cpu"]:>8.2f} {rate:>9.0f}')
+
+        users = sum(stats['users'] for stats in self.stats)
+        cpu = sum(stats['cpu'] for stats in self.stats)
+        cores = cpu / self.elapsed if self.elapsed else 0
+        efficiency = cores / len(self.stats) * 100
+
+        color = green if efficiency >= 50 else yellow
+        print(color(f'\n{" ":<5} {users} users in {self.elapsed:.2f}s ({users / self.elapsed if self.elapsed else 0:.0f} users/s), '
+                    f'cpu {cpu:.2f}s, {cores:.1f} cores used of {len(self.stats)} shards ({efficiency:.0f}%)'))
+        print()
@@ -0,0 +1,83 @@
+# coding: utf-8
+
+import gzip
+import json
+from datetime import datetime, timezone
+from modules.utils import yellow, path_expander, print_error
+
+SNAPSHOT_VERSION = 1
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+# snapshot of the list_users responses
+# gzip compressed JSON Lines, a header line followed
+# by one raw SCIM user resource per line as returned
+# by the IAM Domain, written while pages are fetched
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+class SnapshotWriter:
+
+    def __init__(self, path, endpoint, compresslevel=6):
+        self.path = path_expander(path)
+        self.stream = gzip.open(self.path, 'wt', encoding='utf-8', compresslevel=compresslevel)
+        self.count = 0
+        self.write({
+                    'snapshot': SNAPSHOT_VERSION,
+                    'endpoint': endpoint,
+                    'taken': datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.000Z")
+                    })
+
+    def write(self, resource):
+        self.stream.write(json.dumps(resource, separators=(',', ':')))
+        self.stream.write('\n')
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - -
+    # write resources as they stream through
+    # serialize converts sdk models back to SCIM json
+    # - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    def tee(self, resources, serialize=None):
+        for resource in resources:
+            self.write(serialize(resource) if serialize else resource)
+            self.count += 1
+            yield resource
+
+    def close(self):
+        self.stream.close()
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+# read a snapshot
+# output - header dict
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def read_snapshot_header(path):
+
+    try:
+        with gzip.open(path_expander(path), 'rt', encoding='utf-8') as stream:
+            header = json.loads(stream.readline() or '{}')
+    except (OSError, ValueError) as e:
+        print_error("Snapshot error:", path, e)
+        raise SystemExit(1)
+
+    if header.get('snapshot') != SNAPSHOT_VERSION:
+        print_error("Snapshot error:", path, "not a snapshot file or unsupported version")
+        raise SystemExit(1)
+
+    return header
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+# stream the user resources of a snapshot
+# decoded line by line, memory stays flat whatever
+# the size of the domain, a truncated snapshot stops
+# at the last complete resource
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def read_snapshot(path):
+
+    with gzip.open(path_expander(path), 'rt', encoding='utf-8') as stream:
+        stream.readline()
+        try:
+            for line in stream:
+                if line.endswith('\n'):
+                    yield json.loads(line)
+        except (EOFError, ValueError) as e:
+            print_error("Snapshot truncated:", path, e, color=yellow, level='WARNING')
@@ -0,0 +1,199 @@
+# coding: utf-8
+
+import os
+import sqlite3
+from datetime import datetime, timedelta, timezone
+from modules.users import USER_STATE_SCHEMA
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+# local state store
+# sqlite cache of last-seen user metadata keyed by
+# IAM Domain endpoint and user ocid, plus the
+# watermark of the last successful refresh
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+class StateStore:
+
+    # users written per executemany() call
+    BATCH_SIZE = 500
+
+    def __init__(self, path, endpoint):
+        self.path = os.path.expanduser(path)
+        self.endpoint = endpoint.rstrip('/')
+        self.pending = []
+        self.verdicts = []
+        self.db = sqlite3.connect(self.path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS users (
+                endpoint TEXT NOT NULL,
+                ocid TEXT NOT NULL,
+                name TEXT,
+                active INTEGER,
+                domain TEXT,
+                created TEXT,
+                modified TEXT,
+                last_login TEXT,
+                verdict TEXT,
+                run_id TEXT,
+                PRIMARY KEY (endpoint, ocid)
+            );
+            CREATE INDEX IF NOT EXISTS users_name ON users (endpoint, name COLLATE NOCASE);
+            CREATE TABLE IF NOT EXISTS watermarks (
+                endpoint TEXT PRIMARY KEY,
+                watermark TEXT NOT NULL,
+                updated TEXT NOT NULL
+            );
+        """)
+        self.run_id = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - -
+    # watermark of the last completed refresh
+    # - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    def watermark(self):
+        row = self.db.execute("SELECT watermark FROM watermarks WHERE endpoint = ?", (self.endpoint,)).fetchone()
+        return row[0] if row else None
+
+    def set_watermark(self, started, skew_minutes=5):
+        # step back a few minutes to absorb clock skew with the IAM Domain
+        watermark = (started - timedelta(minutes=skew_minutes)).strftime("%Y-%m-%dT%H:%M:%S.000Z")
+        self.db.execute("INSERT OR REPLACE INTO watermarks VALUES (?, ?, ?)",
+                        (self.endpoint, watermark, self.run_id))
+        self.db.commit()
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - -
+    # scim filter returning users changed since watermark
+    # lastSuccessfulLoginDate does not bump meta.lastModified
+    # so logins are queried explicitly
+    # - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    def changes_filter(self):
+        watermark = self.watermark()
+        if watermark is None:
+            return None
+        return (f'meta.lastModified gt "{watermark}" or '
+                f'{USER_STATE_SCHEMA}:lastSuccessfulLoginDate gt "{watermark}"')
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - -
+    # write users to the cache
+    # - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    def upsert(self, fields):
+        self.pending.append((
+                            self.endpoint,
+                            fields['ocid'],
+                            fields['name'],
+                            int(bool(fields['active'])),
+                            fields['domain'],
+                            fields['created'],
+                            fields['modified'],
+                            fields['last_login'],
+                            self.run_id
+                            ))
+        if len(self.pending) >= self.BATCH_SIZE:
+            self.flush()
+
+    def flush(self):
+        if self.pending:
+            self.db.executemany("""
+                INSERT INTO users (endpoint, ocid, name, active, domain, created, modified, last_login, run_id)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (endpoint, ocid) DO UPDATE SET
+                    name = excluded.name,
+                    active = excluded.active,
+                    domain = excluded.domain,
+                    created = excluded.created,
+                    modified = excluded.modified,
+                    last_login = excluded.last_login,
+                    run_id = excluded.run_id
+            """, self.pending)
+            self.pending = []
+        self.db.commit()
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - -
+    # record last verdict of a user
+    # buffered so the cache can be updated while
+    # users() is still being iterated
+    # - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    def record_verdict(self, ocid, verdict, active):
+        self.verdicts.append((verdict, int(bool(active)), self.endpoint, ocid))
+
+    def flush_verdicts(self):
+        if self.verdicts:
+            self.db.executemany("UPDATE users SET verdict = ?, active = ? WHERE endpoint = ? AND ocid = ?",
+                                self.verdicts)
+            self.verdicts = []
+        self.db.commit()
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - -
+    # drop users not seen during a full refresh
+    # - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    def prune(self):
+        self.flush()
+        deleted = self.db.execute("DELETE FROM users WHERE endpoint = ? AND run_id != ?",
+                                  (self.endpoint, self.run_id)).rowcount
+        self.db.commit()
+        return deleted
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - -
+    # drop users deleted on the server
+    # - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    def delete(self, ocids):
+        self.flush()
+        deleted = 0
+        for ocid in ocids:
+            deleted += self.db.execute("DELETE FROM users WHERE endpoint = ? AND ocid = ?",
+                                       (self.endpoint, ocid)).rowcount
+        self.db.commit()
+        return deleted
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - -
+    # cached users ordered by userName
+    # yields the same fields as users.user_fields()
+    # - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    def users(self):
+        self.flush()
+        cursor = self.db.execute("""
+            SELECT ocid, name, active, domain, created, modified, last_login
+            FROM users WHERE endpoint = ? ORDER BY name COLLATE NOCASE
+        """, (self.endpoint,))
+        for ocid, name, active, domain, created, modified, last_login in cursor:
+            yield {
+                    'ocid': ocid,
+                    'name': name,
+                    'active': bool(active),
+                    'domain': domain,
+                    'created': created,
+                    'modified': modified,
+                    'last_login': last_login
+                    }
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - -
+    # compare cache with users retrieved from the server
+    # output - {missing, unknown, stale} ocid lists
+    # - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    def drift(self, server_users):
+        cached = dict(self.db.execute("SELECT ocid, modified FROM users WHERE endpoint = ?",
+                                      (self.endpoint,)))
+        unknown = []
+        stale = []
+
+        for fields in server_users:
+            if fields['ocid'] not in cached:
+                unknown.append(fields['ocid'])
+            elif cached.pop(fields['ocid']) != fields['modified']:
+                stale.append(fields['ocid'])
+
+        return {'missing': list(cached), 'unknown': unknown, 'stale': stale}
+
+    def close(self):
+        self.flush()
+        self.flush_verdicts()
+        self.db.close()
@@ -0,0 +1,432 @@
+# coding: utf-8
+
+import re
+import json
+import time
+import random
+import threading
+import urllib.parse
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+USER_STATE_SCHEMA = "urn:ietf:params:scim:schemas:oracle:idcs:extension:userState:User"
+USER_SCHEMA = "urn:ietf:params:scim:schemas:core:2.0:User"
+GROUP_SCHEMA = "urn:ietf:params:scim:schemas:core:2.0:Group"
+LIST_RESPONSE_SCHEMA = "urn:ietf:params:scim:api:messages:2.0:ListResponse"
+BULK_RESPONSE_SCHEMA = "urn:ietf:params:scim:api:messages:2.0:BulkResponse"
+USER_STATUS_CHANGER_SCHEMA = "urn:ietf:params:scim:schemas:oracle:idcs:UserStatusChanger"
+USER_EXTENSION_SCHEMA = "urn:ietf:params:scim:schemas:oracle:idcs:extension:user:User"
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+# synthetic IAM Domain
+# users are built on demand from their index so 1M
+# user domains do not have to be held in memory,
+# userNames are zero padded and sort in index order
+# percentages split users in disabled accounts, users
+# who never logged in, dormant & active users
+# groups map a displayName to every n-th user
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+class SyntheticDomain:
+
+    def __init__(self, size, disabled_pct=5, never_pct=10, dormant_pct=20, seed=0, now=None, groups=None):
+        self.size = size
+        self.groups = groups if groups is not None else {'Administrators': 500, 'Contractors': 10}
+        self.disabled_pct = disabled_pct
+        self.never_pct = never_pct
+        self.dormant_pct = dormant_pct
+        self.seed = seed
+        self.now = now or datetime.now(timezone.utc).replace(tzinfo=None)
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.disabled = {}          # index -> lastModified of users disabled by the tool
+            self.filters = {}           # (filter, generation) -> matching indexes
+            self.generation = 0
+
+    def timestamp(self, days):
+        return (self.now - timedelta(days=days)).strftime("%Y-%m-%dT%H:%M:%S.000Z")
+
+    def ocid(self, index):
+        return f"ocid1.user.oc1..bench{index:012d}"
+
+    def index(self, ocid):
+        match = re.fullmatch(r"ocid1\.user\.oc1\.\.bench(\d{12})", ocid or '')
+        index = int(match.group(1)) if match else -1
+        return index if 0 <= index < self.size else None
+
+    def user(self, index):
+
+        # cheap deterministic hash, the same index always gives the same user
+        digest = (index * 2654435761 + self.seed * 97) % 4294967296
+        profile = digest % 100
+        modified = self.disabled.get(index)
+
+        user = {
+                'schemas': [USER_SCHEMA],
+                'id': f"{index:032x}",
+                'ocid': self.ocid(index),
+                'userName': f"user{index:07d}@bench.example",
+                'active': profile >= self.disabled_pct and modified is None,
+                'domainOcid': "ocid1.domain.oc1..bench",
+                'meta': {
+                        'resourceType': 'User',
+                        'created': self.timestamp(500 + digest % 500),
+                        'lastModified': modified or self.timestamp(400 + digest % 100)
+                        }
+                }
+
+        if profile < self.disabled_pct + self.never_pct:
+            return user
+        if profile < self.disabled_pct + self.never_pct + self.dormant_pct:
+            days = 90 + (digest >> 8) % 365
+        else:
+            days = (digest >> 8) % 59
+        user[USER_STATE_SCHEMA] = {'lastSuccessfulLoginDate': self.timestamp(days)}
+
+        return user
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - -
+    # user returned with attributeSets=all
+    # adds the name, emails, groups & extension blobs
+    # the real endpoint returns with every attribute
+    # - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    def full_user(self, index):
+
+        user = self.user(index)
+        login = user.get(USER_STATE_SCHEMA, {}).get('lastSuccessfulLoginDate')
+        local = user['userName'].split('@')[0]
+
+        user['schemas'] = [USER_SCHEMA, USER_EXTENSION_SCHEMA, USER_STATE_SCHEMA]
+        user['displayName'] = f"Bench User {index}"
+        user['name'] = {'givenName': 'Bench', 'familyName': f"User {index}", 'formatted': f"Bench User {index}"}
+        user['emails'] = [{'value': user['userName'], 'type': 'work', 'primary': True, 'verified': False},
+                          {'value': f"{local}@recovery.example", 'type': 'recovery', 'primary': False, 'verified': False}]
+        user['groups'] = [{'value': f"group{position:08d}", 'ocid': f"ocid1.group.oc1..bench{position:08d}",
+                           'display': name, 'type': 'direct', 'nonUniqueDisplay': name}
+                          for position, (name, every) in enumerate(self.groups.items(), start=1) if index % every == 0]
+        user['idcsCreatedBy'] = {'value': 'bench', 'type': 'App', 'display': 'bench provisioning'}
+        user['meta']['location'] = f"/admin/v1/Users/{user['id']}"
+        user[USER_EXTENSION_SCHEMA] = {'isFederatedUser': False, 'status': 'active', 'provider': 'IDCS',
+                                       'creationMechanism': 'api', 'doNotShowGettingStarted': True}
+        user[USER_STATE_SCHEMA] = {'loginAttempts': 0, 'locked': {'on': False}, 'recoveryLocked': {'on': False}}
+        if login:
+            user[USER_STATE_SCHEMA]['lastSuccessfulLoginDate'] = login
+            user[USER_STATE_SCHEMA]['previousSuccessfulLoginDate'] = login
+
+        return user
+
+    def group(self, position, name):
+        return {
+                'schemas': [GROUP_SCHEMA],
+                'id': f"group{position:08d}",
+                'ocid': f"ocid1.group.oc1..bench{position:08d}",
+                'displayName': name,
+                'members': [{'value': f"{index:032x}", 'ocid': self.ocid(index), 'type': 'User'}
+                            for index in range(0, self.size, self.groups[name])]
+                }
+
+    def group_page(self, start_index, count, scim_filter=None):
+
+        expression = parse_filter(scim_filter) if scim_filter else None
+        names = [name for name in self.groups if expression is None or expression({'displayName': name})]
+        page = names[start_index - 1:start_index - 1 + count]
+
+        return len(names), [self.group(start_index + position, name) for position, name in enumerate(page)]
+
+    def disable(self, ocid):
+        index = self.index(ocid)
+        if index is None:
+            return None
+        with self.lock:
+            self.disabled[index] = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.000Z")
+            self.generation += 1
+        return self.user(index)
+
+    # - - - - - - - - - - - - - - - - - - - - - - - - - -
+    # users matching a SCIM filter
+    # the scan is cached per filter until a user changes
+    # - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+    def matching(self, scim_filter):
+
+        key = (scim_filter, self.generation)
+        if key not in self.filters:
+            expression = parse_filter(scim_filter)
+            self.filters = {key: [index for index in range(self.size) if expression(self.user(index))]}
+        return self.filters[key]
+
+    def page(self, start_index, count, scim_filter=None, full=False):
+
+        user = self.full_user if full else self.user
+        if scim_filter:
+            indexes = self.matching(scim_filter)
+            total_results = len(indexes)
+            page = indexes[start_index - 1:start_index - 1 + count]
+        else:
+            total_results = self.size
+            page = range(start_index - 1, min(self.size, start_index - 1 + count))
+
+        return total_results, [user(index) for index in page]
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+# minimal SCIM filter evaluator
+# supports eq ne gt ge lt le co sw pr, and, or,
+# not (...) and parentheses, enough for the filters
+# sent by OCI_IdleUser_Disabler.py
+# output - predicate on a user resource
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+FILTER_TOKENS = re.compile(r'\s*(\(|\)|"(?:[^"\\]|\\.)*"|[^\s()]+)')
+
+def attribute_value(resource, path):
+
+    if path.startswith('urn:'):
+        schema, name = path.rsplit(':', 1)
+        return (resource.get(schema) or {}).get(name)
+
+    value = resource
+    for part in path.split('.'):
+        value = value.get(part) if isinstance(value, dict) else None
+    return value
+
+def parse_filter(scim_filter):
+
+    tokens = FILTER_TOKENS.findall(scim_filter)
+    position = [0]
+
+    def peek():
+        return tokens[position[0]] if position[0] < len(tokens) else None
+
+    def take():
+        position[0] += 1
+        return tokens[position[0] - 1]
+
+    def literal(token):
+        if token.startswith('"'):
+            return json.loads(token)
+        if token.lower() in ('true', 'false'):
+            return token.lower() == 'true'
+        return float(token) if '.' in token else int(token)
+
+    def comparison(path, operator, value):
+        operators = {
+                    'eq': lambda a: a == value,
+                    'ne': lambda a: a != value,
+                    'gt': lambda a: a is not None and a > value,
+                    'ge': lambda a: a is not None and a >= value,
+                    'lt': lambda a: a is not None and a < value,
+                    'le': lambda a: a is not None and a <= value,
+                    'co': lambda a: a is not None and value in a,
+                    'sw': lambda a: a is not None and a.startswith(value)
+                    }
+        test = operators[operator]
+        return lambda resource: test(attribute_value(resource, path))
+
+    def factor():
+        token = take()
+        if token.lower() == 'not':
+            take()  # (
+            inner = expression()
+            take()  # )
+            return lambda resource: not inner(resource)
+        if token == '(':
+            inner = expression()
+            take()  # )
+            return inner
+        operator = take().lower()
+        if operator == 'pr':
+            return lambda resource: attribute_value(resource, token) not in (None, '', [])
+        return comparison(token, operator, literal(take()))
+
+    def term():
+        left = factor()
+        while (peek() or '').lower() == 'and':
+            take()
+            right, previous = factor(), left
+            left = lambda resource, a=previous, b=right: a(resource) and b(resource)
+        return left
+
+    def expression():
+        left = term()
+        while (peek() or '').lower() == 'or':
+            take()
+            right, previous = term(), left
+            left = lambda resource, a=previous, b=right: a(resource) or b(resource)
+        return left
+
+    try:
+        predicate = expression()
+    except (IndexError, KeyError, ValueError):
+        raise ValueError(f"invalid filter: {scim_filter}")
+    if peek() is not None:
+        raise ValueError(f"invalid filter: {scim_filter}")
+
+    return predicate
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+# keep only the requested attributes of a resource
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def project(resource, attributes):
+
+    if not attributes:
+        return resource
+
+    keys = {'schemas', 'id', 'ocid'}
+    for attribute in attributes.split(','):
+        attribute = attribute.strip()
+        keys.add(attribute.rsplit(':', 1)[0] if attribute.startswith('urn:') else attribute.split('.')[0])
+
+    return {key: value for key, value in resource.items() if key in keys}
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+# Identity Domains stub request handler
+# GET  /admin/v1/Users                     list users, all attributeSets
+# GET  /admin/v1/Groups                    list groups
+# PUT  /admin/v1/UserStatusChanger/{ocid}  disable
+# POST /admin/v1/Bulk                      bulk PATCH
+# GET  /n                                  ObjectStorage get_namespace
+# GET  /20160918/tenancies/{ocid}          Identity get_tenancy
+# signatures are not checked
+# the time of the first list users call is kept in
+# server.first_list
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+class StubHandler(BaseHTTPRequestHandler):
+
+    # keep-alive, like the real endpoint
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def send(self, status, payload, headers=None):
+        body = json.dumps(payload, separators=(',', ':')).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/scim+json')
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return json.loads(self.rfile.read(length) or b'{}')
+
+    def throttled(self):
+        # simulated latency & injected 429
+        stub = self.server
+        if stub.latency or stub.jitter:
+            time.sleep(max(0, stub.latency + random.uniform(-stub.jitter, stub.jitter)))
+        if stub.throttle and random.random() < stub.throttle:
+            self.send(429, {'code': 'TooManyRequests', 'message': 'Too many requests', 'detail': 'stub throttling'},
+                      headers={'Retry-After': '1'})
+            return True
+        return False
+
+    def do_GET(self):
+
+        url = urllib.parse.urlsplit(self.path)
+        query = dict(urllib.parse.parse_qsl(url.query))
+
+        pages = {'/admin/v1/Users': self.server.domain.page, '/admin/v1/Groups': self.server.domain.group_page}
+
+        # regional calls validating credentials when -fast is not set
+        if url.path == '/n' or url.path.startswith('/20160918/tenancies/'):
+            if self.throttled():
+                return
+            if url.path == '/n':
+                return self.send(200, 'bench')
+            return self.send(200, {'id': url.path.rsplit('/', 1)[1], 'name': 'bench', 'homeRegionKey': 'IAD'})
+
+        if url.path == '/admin/v1/Users' and self.server.first_list is None:
+            self.server.first_list = time.monotonic()
+
+        if url.path not in pages:
+            return self.send(404, {'detail': f'{url.path} not found'})
+        if self.throttled():
+            return
+
+        try:
+            start_index = max(1, int(query.get('startIndex', 1)))
+            count = min(int(query.get('count', 50)), 1000)
+            if url.path == '/admin/v1/Users' and query.get('attributeSets') == 'all':
+                total_results, resources = self.server.domain.page(start_index, count, query.get('filter'), full=True)
+            else:
+                total_results, resources = pages[url.path](start_index, count, query.get('filter'))
+        except ValueError as e:
+            return self.send(400, {'status': '400', 'detail': str(e)})
+
+        attributes = query.get('attributes')
+        self.send(200, {
+                        'schemas': [LIST_RESPONSE_SCHEMA],
+                        'totalResults': total_results,
+                        'startIndex': start_index,
+                        'itemsPerPage': len(resources),
+                        'Resources': [project(resource, attributes) for resource in resources]
+                        })
+
+    def do_PUT(self):
+
+        url = urllib.parse.urlsplit(self.path)
+        self.read_body()
+
+        if not url.path.startswith('/admin/v1/UserStatusChanger/'):
+            return self.send(404, {'detail': f'{url.path} not found'})
+        if self.throttled():
+            return
+
+        user = self.server.domain.disable(url.path.rsplit('/', 1)[1])
+        if user is None:
+            return self.send(404, {'status': '404', 'detail': 'user not found'})
+
+        self.send(200, {'schemas': [USER_STATUS_CHANGER_SCHEMA], 'id': user['ocid'], 'active': False, 'meta': user['meta']})
+
+    def do_POST(self):
+
+        url = urllib.parse.urlsplit(self.path)
+        payload = self.read_body()
+
+        if url.path != '/admin/v1/Bulk':
+            return self.send(404, {'detail': f'{url.path} not found'})
+        if self.throttled():
+            return
+
+        operations = []
+        for operation in payload.get('Operations', []):
+            user = self.server.domain.disable(operation.get('path', '').rsplit('/', 1)[-1])
+            operations.append({
+                            'method': operation.get('method'),
+                            'bulkId': operation.get('bulkId'),
+                            'status': '200' if user else '404',
+                            'response': {'active': False, 'meta': user['meta']} if user else {'detail': 'user not found'}
+                            })
+
+        self.send(200, {'schemas': [BULK_RESPONSE_SCHEMA], 'Operations': operations})
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+# start the stub in a background thread
+# input - synthetic domain, latency & jitter in
+#         seconds, throttle probability of a 429
+# output - server, stop it with server.shutdown()
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def start_stub(domain, host='127.0.0.1', port=0, latency=0, jitter=0, throttle=0):
+
+    server = ThreadingHTTPServer((host, port), StubHandler)
+    server.daemon_threads = True
+    server.domain = domain
+    server.latency = latency
+    server.jitter = jitter
+    server.throttle = throttle
+    server.first_list = None
+    server.url = f"http://{host}:{server.server_port}"
+
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    return server
@@ -0,0 +1,272 @@
+# coding: utf-8
+
+import oci
+import sys
+import time
+import random
+import heapq
+import threading
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor
+from modules.metrics import METRICS
+
+USER_STATE_SCHEMA = "urn:ietf:params:scim:schemas:oracle:idcs:extension:userState:User"
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+# user fields read by the script
+# field key, matching SCIM attribute and sdk model path,
+# used to build the attributes= projection sent to
+# list_users and both user_fields readers below
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+USER_FIELDS = [
+                ('ocid', 'ocid', 'ocid'),
+                ('name', 'userName', 'user_name'),
+                ('active', 'active', 'active'),
+                ('domain', 'domainOcid', 'domain_ocid'),
+                ('created', 'meta.created', 'meta.created'),
+                ('modified', 'meta.lastModified', 'meta.last_modified'),
+                ('last_login', f'{USER_STATE_SCHEMA}:lastSuccessfulLoginDate',
+                    'urn_ietf_params_scim_schemas_oracle_idcs_extension_user_state_user.last_successful_login_date'),
+                ]
+
+USER_ATTRIBUTES = ",".join(attribute for _, attribute, _ in USER_FIELDS)
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+# split a SCIM attribute into json keys
+# schema extension attributes are urn:...:Schema:name
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def scim_path(attribute):
+
+    if attribute.startswith('urn:'):
+        return attribute.rsplit(':', 1)
+    return attribute.split('.')
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+# read user fields from a sdk User model
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def user_fields(user):
+
+    fields = {}
+    for key, _, path in USER_FIELDS:
+        value = user
+        for name in path.split('.'):
+            value = getattr(value, name, None) if value is not None else None
+        fields[key] = value
+    return fields
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+# read user fields from a raw SCIM json resource
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def raw_user_fields(resource):
+
+    fields = {}
+    for key, attribute, _ in USER_FIELDS:
+        value = resource
+        for name in scim_path(attribute):
+            value = (value or {}).get(name)
+        fields[key] = value
+    return fields
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+# print paging progress
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def print_progress(pages, users, start_time, total=None, resource='users'):
+    elapsed = max(time.monotonic() - start_time, 1e-6)
+    rate = users / elapsed
+    total = f"/{total}" if total is not None else ""
+    print(f"   Retrieving {resource}... pages: {pages} {resource}: {users}{total} ({rate:.0f} {resource}/s)",
+          end=' '*10+'\r', file=sys.stderr, flush=True)
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+# list users page by page
+# follows SCIM startIndex/totalResults paging and
+# yields users one by one so memory stays flat
+# start_index & stop_index limit the listing to a
+# range of the sorted users
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def list_users_paged(identity_domain_client, page_size=1000, progress=True, start_index=1, stop_index=None, **kwargs):
+
+    kwargs.setdefault('attributes', USER_ATTRIBUTES)
+    kwargs.setdefault('sort_by', "userName")
+    kwargs.setdefault('sort_order', "ASCENDING")
+
+    pages = 0
+    fetched = 0
+    start_time = time.monotonic()
+
+    while True:
+        count = page_size if stop_index is None else min(page_size, stop_index - start_index + 1)
+        response = call_with_backoff(METRICS.wrap('list_users', identity_domain_client.list_users),
+                                     start_index=start_index,
+                                     count=count,
+                                     **kwargs)
+        resources = response.data.resources or []
+        total_results = response.data.total_results
+
+        pages += 1
+        fetched += len(resources)
+
+        if progress:
+            print_progress(pages, fetched, start_time, total_results)
+
+        for user in resources:
+            yield user
+
+        start_index += len(resources)
+
+        # stop on an empty page, once totalResults or stop_index is reached
+        if not resources or (total_results is not None and start_index > total_results):
+            break
+        if stop_index is not None and start_index > stop_index:
+            break
+
+    if progress:
+        print(' '*94, end='\r', file=sys.stderr, flush=True)
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+# call with exponential backoff on 429
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def call_with_backoff(func, *args, max_attempts=6, base_sleep=1, max_sleep=30, **kwargs):
+
+    attempt = 0
+    while True:
+        try:
+            return func(*args, **kwargs)
+        except oci.exceptions.ServiceError as e:
+            attempt += 1
+            if e.status != 429 or attempt >= max_attempts:
+                raise
+            METRICS.retry(getattr(func, '__name__', 'call'))
+            # full jitter keeps parallel workers from retrying in lockstep
+            time.sleep(random.uniform(0, min(max_sleep, base_sleep * 2 ** attempt)))
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+# list users with concurrent page fetching
+# the first page gives totalResults, remaining
+# startIndex offsets are fetched on a bounded pool,
+# one client per worker thread, and pages are yielded
+# in startIndex order to keep userName sorting
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def list_users_parallel(client_factory, page_size=1000, workers=4, progress=True, **kwargs):
+
+    kwargs.setdefault('attributes', USER_ATTRIBUTES)
+    kwargs.setdefault('sort_by', "userName")
+    kwargs.setdefault('sort_order', "ASCENDING")
+
+    local = threading.local()
+
+    def fetch_page(start_index):
+        if not hasattr(local, 'client'):
+            local.client = client_factory()
+        response = call_with_backoff(METRICS.wrap('list_users', local.client.list_users),
+                                     start_index=start_index,
+                                     count=page_size,
+                                     **kwargs)
+        return response.data.resources or []
+
+    start_time = time.monotonic()
+
+    first_page = call_with_backoff(METRICS.wrap('list_users', client_factory().list_users),
+                                   start_index=1,
+                                   count=page_size,
+                                   **kwargs)
+    resources = first_page.data.resources or []
+    total_results = first_page.data.total_results or len(resources)
+
+    pages = 1
+    fetched = len(resources)
+    if progress:
+        print_progress(pages, fetched, start_time, total_results)
+
+    for user in resources:
+        yield user
+
+    if not resources:
+        return
+
+    # the server may cap the page size below the requested count
+    step = len(resources)
+    offsets = list(range(1 + step, total_results + 1, step))
+
+    # keep a bounded window of pages in flight so memory stays flat
+    window = max(1, workers) * 2
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        pending = [executor.submit(fetch_page, offset) for offset in offsets[:window]]
+        next_offset = len(pending)
+
+        while pending:
+            page = pending.pop(0).result()
+
+            if next_offset < len(offsets):
+                pending.append(executor.submit(fetch_page, offsets[next_offset]))
+                next_offset += 1
+
+            pages += 1
+            fetched += len(page)
+            if progress:
+                print_progress(pages, fetched, start_time, total_results)
+
+            for user in page:
+                yield user
+
+    if progress:
+        print(' '*94, end='\r', file=sys.stderr, flush=True)
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+# build server-side filters for candidate users
+# output - [dormant users filter, never logged-in filter]
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def candidate_filters(days_history, now=None):
+
+    now = now or datetime.now(timezone.utc)
+    # a user is dormant once more than days_history full days have elapsed
+    cutoff = (now - timedelta(days=days_history + 1)).strftime("%Y-%m-%dT%H:%M:%S.000Z")
+
+    return [
+            f'active eq true and {USER_STATE_SCHEMA}:lastSuccessfulLoginDate lt "{cutoff}"',
+            f'active eq true and not ({USER_STATE_SCHEMA}:lastSuccessfulLoginDate pr)'
+            ]
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+# build filters fetching users by ocid
+# chunk_size ocids are or-ed in each filter
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def ocid_filters(ocids, chunk_size=50):
+
+    ocids = list(ocids)
+    return [' or '.join(f'ocid eq "{ocid}"' for ocid in ocids[offset:offset + chunk_size])
+            for offset in range(0, len(ocids), chunk_size)]
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+# check if the domain accepts a filter
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def filter_supported(identity_domain_client, scim_filter):
+
+    try:
+        call_with_backoff(identity_domain_client.list_users,
+                          filter=scim_filter,
+                          attributes="ocid",
+                          count=1)
+        return True
+    except oci.exceptions.ServiceError as e:
+        if e.status == 400:
+            return False
+        raise
+
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+# merge several userName sorted user field streams
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+def merge_by_username(*streams):
+    return heapq.merge(*streams, key=lambda fields: (fields['name'] or '').lower())
@@ -1,8 +1,9 @@
 # coding: utf-8
 
 import os 
-from os import system, name
 import re
+import sys
+import shutil
 import datetime
 
 def validate_datetime_format(datetime_str):
@@ -54,10 +55,15 @@ class Color:
     ESCAPE_SEQ_START = '\033[{}m'
     ESCAPE_SEQ_END = '\033[0m'
 
+    # ANSI codes are skipped when output is not a terminal
+    enabled = True
+
     def __init__(self, code):
         self.code = code
 
     def __call__(self, text):
+        if not Color.enabled:
+            return text
         try:
             return f'{self.ESCAPE_SEQ_START.format(self.code)}{text}{self.ESCAPE_SEQ_END}'
         except Exception:
@@ -82,18 +88,31 @@ green_b = Color(42)
 red_b = Color(41)
 black_b = Color(40)
 
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+# terminal detection
+# colors are enabled on a terminal unless NO_COLOR is
+# set, quiet hides the informational lines
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+QUIET = False
+
+def set_terminal(stream, quiet=False):
+    global QUIET
+    QUIET = quiet
+    Color.enabled = stream.isatty() and 'NO_COLOR' not in os.environ
+
 # - - - - - - - - - - - - - - - - - - - - - - - - - -
 # clear shell screen
+# scrolls the screen by the terminal height instead
+# of running a clear command, skipped off a terminal
 # - - - - - - - - - - - - - - - - - - - - - - - - - -
 
 def clear():
-    try:
-        if name == 'nt':  # Windows
-            system('cls')
-        else:  # Mac and Linux
-            system('clear')
-    except Exception:
-        pass
+    if not sys.stdout.isatty():
+        return
+    lines = shutil.get_terminal_size().lines
+    sys.stdout.write('\n' * lines + ('\033[H' if Color.enabled else ''))
+    sys.stdout.flush()
 
 # - - - - - - - - - - - - - - - - - - - - - - - - - -
 # expand local path
@@ -113,6 +132,8 @@ def path_expander(path):
 # - - - - - - - - - - - - - - - - - - - - - - - - - -
 
 def print_info(color, v1, v2, v3):
+    if QUIET:
+        return
     align = '<35' if isinstance(v3, int) else '35'
     print(color(f"{'*'*5:10} {v1:20} {v2:20} {v3:{align}} {'*'*5:5}"))
 
@@ -146,23 +167,51 @@ def print_error(*args, color=red, level='ERROR'):
     print(blank_line)
     print(color("╚" + "=" * error_box_width + "╝\n"))
 
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+# buffered row renderer
+# rows are joined and written in chunks of chunk_size
+# rows, one write & flush per chunk instead of one
+# print per row, the stream is looked up on flush so
+# stdout redirections are followed
+# - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+class Renderer:
+
+    def __init__(self, stream=None, chunk_size=500):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.rows = []
+
+    def write(self, row):
+        self.rows.append(row)
+        if len(self.rows) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        if not self.rows:
+            return
+        stream = self.stream or sys.stdout
+        stream.write('\n'.join(self.rows) + '\n')
+        stream.flush()
+        self.rows.clear()
+
 # - - - - - - - - - - - - - - - - - - - - - - - - - -
 # print formated output 
 # - - - - - - - - - - - - - - - - - - - - - - - - - -
 
-def print_output(color, user_rank, data, details=True):
+def format_output(color, user_rank, record, details=True):
 
     rank = str(user_rank)
-    user = data.get('name')
-    last_login = data.get('last_login')
-    state = data.get('state')
-    active = data.get('active')
-    days = data.get('days')
-    ocid = data.get('ocid')
+    user = record.name
+    last_login = record.last_login or "None"
+    state = 'Exempt' if record.exempt else record.state.value
+    active = 'True' if record.active else 'False'
+    days = '-' if record.days is None else record.days
+    ocid = record.ocid
 
     ocid = ocid if details else "..." + ocid[-10:]
     
-    formatted_string = color(
+    return color(
         f'{rank:<5} '
         f'{user[0:40]:<40} '
         f'{last_login:<30} '
@@ -171,7 +220,6 @@ def print_output(color, user_rank, data, details=True):
         f'{days:<13} '
         f'{ocid:<40}'
     )
-    print(formatted_string)
 
 # - - - - - - - - - - - - - - - - - - - - - - - - - -
 # calculate time delta